@@ -0,0 +1,218 @@
+import io
+import os
+import json
+from sqlalchemy import ARRAY, Integer, create_engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.pool import NullPool
+from dotenv import load_dotenv
+
+from app.db.session import DATABASE_URL, engine
+from app.utils.content_hash import content_hash
+
+load_dotenv()
+COPY_CHUNK_ROWS = int(os.getenv("COPY_CHUNK_ROWS", 20000))
+
+def copy_upsert(table, rows, chunk_size=COPY_CHUNK_ROWS, bind=engine):
+    # Upserts dicts of column -> value into `table` (a model's __table__): each chunk is
+    # COPYed into a temp staging table shaped like the target and merged with one
+    # INSERT ... SELECT ... ON CONFLICT (pk) DO UPDATE, then committed. Replaces per-row
+    # Session.merge, which SELECTs every key before writing it. Within a chunk the last
+    # row for a key wins, as it would with merge. If the table has a content_hash column it
+    # is filled in here and rows whose stored hash matches are left untouched. Returns the
+    # number of rows inserted or changed.
+    columns = [c.name for c in loaded_columns(table)]
+    keys = [c.name for c in table.primary_key.columns]
+    encoders = [column_encoder(c) for c in loaded_columns(table)]
+    upsert = upsert_sql(table.name, columns, keys)
+
+    total = 0
+    conn = bind.raw_connection()
+    try:
+        chunk = {}
+        for row in with_content_hash(table, rows):
+            chunk[tuple(row[k] for k in keys)] = row
+            if len(chunk) >= chunk_size:
+                total += copy_chunk(conn, table.name, columns, encoders, upsert, chunk.values())
+                chunk = {}
+        if chunk:
+            total += copy_chunk(conn, table.name, columns, encoders, upsert, chunk.values())
+    finally:
+        conn.close()
+    return total
+
+
+def copy_chunk(conn, table_name, columns, encoders, upsert, rows):
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f'CREATE TEMP TABLE "staging_{table_name}" (LIKE "{table_name}" INCLUDING DEFAULTS) ON COMMIT DROP')
+            count = copy_rows(cur, f"staging_{table_name}", columns, encoders, rows)
+            cur.execute(upsert)
+            written = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"Upserted {count} rows into {table_name} ({written} new or changed)")
+    return written
+
+
+def copy_rows(cur, target, columns, encoders, rows):
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write("\t".join(encode(row.get(name)) for name, encode in zip(columns, encoders)))
+        buffer.write("\n")
+        count += 1
+    buffer.seek(0)
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    cur.copy_expert(f'COPY "{target}" ({column_list}) FROM STDIN', buffer)
+    return count
+
+
+# Parallel loads: workers COPY whole files into one shared UNLOGGED staging table, tagging
+# each row with the rank of its file and its line number, then merge disjoint key
+# partitions into the target. A key seen more than once resolves to the row from the
+# highest ranked file, last line first, whatever order the workers finished in.
+
+def create_staging(table, bind=engine):
+    staging = f"{table.name}_load_staging"
+    with bind.begin() as conn:
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{staging}"')
+        conn.exec_driver_sql(f'CREATE UNLOGGED TABLE "{staging}" (LIKE "{table.name}" INCLUDING DEFAULTS)')
+        conn.exec_driver_sql(f'ALTER TABLE "{staging}" ADD COLUMN file_rank integer NOT NULL, ADD COLUMN line_no bigint NOT NULL')
+    return staging
+
+
+def stage_rows(table, staging, rows, file_rank, chunk_size=COPY_CHUNK_ROWS, bind=engine):
+    # COPYs rows into staging, committing every chunk_size rows; returns the row count
+    columns = [c.name for c in loaded_columns(table)] + ["file_rank", "line_no"]
+    encoders = [column_encoder(c) for c in loaded_columns(table)] + [str, str]
+    total = 0
+    conn = bind.raw_connection()
+    try:
+        chunk = []
+        for line_no, row in enumerate(with_content_hash(table, rows)):
+            chunk.append({**row, "file_rank": file_rank, "line_no": line_no})
+            if len(chunk) >= chunk_size:
+                total += commit_staged(conn, staging, columns, encoders, chunk)
+                chunk = []
+        if chunk:
+            total += commit_staged(conn, staging, columns, encoders, chunk)
+    finally:
+        conn.close()
+    return total
+
+
+def commit_staged(conn, staging, columns, encoders, rows):
+    try:
+        with conn.cursor() as cur:
+            count = copy_rows(cur, staging, columns, encoders, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+
+def merge_staging(table, staging, part=0, parts=1, bind=engine):
+    # Upserts the newest staged row of every key in partition `part` of `parts`; returns the
+    # number of rows inserted or changed
+    columns = [c.name for c in loaded_columns(table)]
+    keys = [c.name for c in table.primary_key.columns]
+    where = f"WHERE {partition_expr(table, parts)} = {int(part)}" if parts > 1 else ""
+    sql = upsert_sql(table.name, columns, keys, source=staging, where=where, newest_first="file_rank DESC, line_no DESC")
+    conn = bind.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            count = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return count
+
+
+def loaded_columns(table):
+    # columns the loaders write; db_maintained ones (e.g. pubmed.search_vector) are left to
+    # their triggers
+    return [c for c in table.columns if not c.info.get("db_maintained")]
+
+
+def with_content_hash(table, rows):
+    if "content_hash" not in table.columns:
+        yield from rows
+        return
+    for row in rows:
+        yield {**row, "content_hash": content_hash(row)}
+
+
+def partition_expr(table, parts):
+    # integer keys split by modulo (pmid % parts), anything else by hash
+    keys = list(table.primary_key.columns)
+    if len(keys) == 1 and isinstance(keys[0].type, Integer):
+        return f'mod("{keys[0].name}", {int(parts)})'
+    key_text = " || '|' || ".join(f'"{k.name}"::text' for k in keys)
+    return f"mod(abs(hashtext({key_text})::bigint), {int(parts)})"
+
+
+def drop_staging(staging, bind=engine):
+    with bind.begin() as conn:
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{staging}"')
+
+
+_worker_engine = None
+
+def worker_engine():
+    # Engine for a pool worker process: its own connections, none inherited across fork
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = create_engine(DATABASE_URL, poolclass=NullPool)
+    return _worker_engine
+
+
+def upsert_sql(table_name, columns, keys, source=None, where="", newest_first=None):
+    # newest_first orders duplicate keys in `source` so DISTINCT ON keeps the wanted row
+    source = source or f"staging_{table_name}"
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    key_list = ", ".join(f'"{k}"' for k in keys)
+    updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in columns if c not in keys)
+    action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+    distinct = f"DISTINCT ON ({key_list}) " if newest_first else ""
+    order = f"ORDER BY {key_list}, {newest_first}" if newest_first else ""
+    rows = " ".join(part for part in (f'SELECT {distinct}{column_list} FROM "{source}"', where, order) if part)
+    source_columns = ", ".join(f's."{c}"' for c in columns)
+    select = f"SELECT {source_columns} FROM ({rows}) AS s"
+    if "content_hash" in columns:
+        # Rows whose hash matches the stored one never reach the INSERT, so they fire no
+        # triggers (pubmed.search_vector) and leave no dead tuple or WAL. The filter runs
+        # after DISTINCT ON, so only the newest staged row is compared.
+        select += f' LEFT JOIN "{table_name}" AS t USING ({key_list}) WHERE t."content_hash" IS DISTINCT FROM s."content_hash"'
+        if updates:
+            # still guards rows another load changed in the meantime
+            action += f' WHERE "{table_name}"."content_hash" IS DISTINCT FROM EXCLUDED."content_hash"'
+    return f'INSERT INTO "{table_name}" ({column_list}) {select} ON CONFLICT ({key_list}) {action}'
+
+
+# COPY text format: tab separated, \N for NULL, backslash escapes
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+def column_encoder(column):
+    if isinstance(column.type, JSONB):
+        return lambda value: r"\N" if value is None else json.dumps(value, ensure_ascii=False).translate(COPY_ESCAPES)
+    if isinstance(column.type, ARRAY):
+        return lambda value: r"\N" if value is None else array_literal(value).translate(COPY_ESCAPES)
+    return lambda value: r"\N" if value is None else str(value).translate(COPY_ESCAPES)
+
+
+def array_literal(values):
+    # {"a","b \"c\""}; every element quoted so commas, braces and spaces survive
+    items = []
+    for value in values:
+        if value is None:
+            items.append("NULL")
+        else:
+            items.append('"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"')
+    return "{" + ",".join(items) + "}"
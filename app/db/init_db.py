@@ -4,4 +4,34 @@ from .base import Base
 
 # JUST NEED TO CALL ONCE TO CREATE TABLES
 # python -m app.db.init_db
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+Base.metadata.create_all(bind=engine)
+
+# create_all only creates missing tables; columns added since go here
+with engine.begin() as conn:
+    for table in (PubMed.__table__, ClinicalTrials.__table__):
+        conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN IF NOT EXISTS content_hash VARCHAR')
+    conn.exec_driver_sql("ALTER TABLE pubmed ADD COLUMN IF NOT EXISTS search_vector TSVECTOR")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_pubmed_search_vector ON pubmed USING GIN (search_vector)")
+
+    # search_vector is filled by a trigger rather than a generated column because
+    # array_to_string is not immutable
+    conn.exec_driver_sql("""
+        CREATE OR REPLACE FUNCTION pubmed_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(array_to_string(NEW.mesh_terms, ' '), '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(NEW.abstract, '')), 'C') ||
+                setweight(to_tsvector('english', coalesce(NEW.journal_title, '')), 'D');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    conn.exec_driver_sql("DROP TRIGGER IF EXISTS pubmed_search_vector ON pubmed")
+    conn.exec_driver_sql("""
+        CREATE TRIGGER pubmed_search_vector
+        BEFORE INSERT OR UPDATE OF title, journal_title, abstract, mesh_terms ON pubmed
+        FOR EACH ROW EXECUTE FUNCTION pubmed_search_vector_update()
+    """)
+    # rows loaded before the trigger existed are filled in batches by
+    # python -m app.db.maintenance
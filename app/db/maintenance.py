@@ -0,0 +1,31 @@
+from app.db.session import engine
+
+BACKFILL_BATCH_PMIDS = 50000
+
+def backfill_search_vector(batch_size=BACKFILL_BATCH_PMIDS, bind=engine):
+    # One-off for rows loaded before the pubmed_search_vector trigger existed. Walks pmid
+    # ranges of batch_size, touching title so the trigger fills search_vector, and commits
+    # each range, so there is no table-long lock or single WAL burst. Rows that already have
+    # a vector are skipped, so it can be stopped and rerun.
+    with bind.connect() as conn:
+        low, high = conn.exec_driver_sql("SELECT min(pmid), max(pmid) FROM pubmed WHERE search_vector IS NULL").one()
+    if low is None:
+        print("Every pubmed row already has a search_vector")
+        return 0
+
+    total = 0
+    for start in range(low, high + 1, batch_size):
+        with bind.begin() as conn:
+            result = conn.exec_driver_sql(
+                "UPDATE pubmed SET title = title WHERE pmid >= %(start)s AND pmid < %(end)s AND search_vector IS NULL",
+                {"start": start, "end": start + batch_size},
+            )
+        total += result.rowcount
+        print(f"pmids {start}-{start + batch_size - 1}: {result.rowcount} rows indexed ({total} so far)")
+    return total
+
+
+if __name__ == "__main__":
+    # After init_db, once, on a database loaded before search_vector existed
+    # python -m app.db.maintenance
+    backfill_search_vector()
@@ -1,5 +1,5 @@
-from sqlalchemy import ARRAY, Integer, String, Date, Text
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import ARRAY, Index, Integer, String, Date, Text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column
 from .base import Base
 from datetime import date
@@ -16,6 +16,15 @@ class PubMed(Base):
     mesh_terms: Mapped[list[str]] = mapped_column(ARRAY(String), nullable=False)
     date_published: Mapped[date | None] = mapped_column(Date, nullable=True)
     language: Mapped[str | None] = mapped_column(String, nullable=True)
+    # sha256 of the loaded record, filled by app.db.bulk; reloads skip rows whose hash matches
+    content_hash: Mapped[str | None] = mapped_column(String, nullable=True)
+    # weighted title (A) > mesh_terms (B) > abstract (C) > journal_title (D); kept up to date by
+    # the pubmed_search_vector trigger from init_db, so loaders never write it
+    search_vector: Mapped[str | None] = mapped_column(TSVECTOR, nullable=True, deferred=True, info={"db_maintained": True})
+
+    __table_args__ = (
+        Index("ix_pubmed_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
 class ClinicalTrials(Base):
     __tablename__ = 'clinicaltrials'
@@ -40,6 +49,7 @@ class ClinicalTrials(Base):
     start_date: Mapped[date | None] = mapped_column(Date, nullable=True)
     completion_date: Mapped[date | None] = mapped_column(Date, nullable=True)
     last_update_post_date: Mapped[date | None] = mapped_column(Date, nullable=True)
+    content_hash: Mapped[str | None] = mapped_column(String, nullable=True)
     
     # OLD
     # nct_id = Column(String, primary_key=True)
@@ -1,6 +1,6 @@
 from fastapi import Depends, APIRouter, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func, select, or_
+from sqlalchemy import func, select
 from datetime import date
 from typing import List
 
@@ -40,12 +40,11 @@ def search_pubmed(
         filters.append(PubMed.language.ilike(f"%{language}%"))
     
     if term:
-        filters.append(or_(
-            PubMed.title.ilike(f"%{term}%"),
-            PubMed.journal_title.ilike(f"%{term}%"),
-            PubMed.abstract.ilike(f"%{term}%"),
-            func.array_to_string(PubMed.mesh_terms, '||').ilike(f"%{term}%")
-        ))
+        # GIN-indexed full-text match over title, MeSH terms, abstract and journal, best first;
+        # websearch syntax allows "quoted phrases", OR and -excluded words
+        query = func.websearch_to_tsquery("english", term)
+        filters.append(PubMed.search_vector.op("@@")(query))
+        stmt = stmt.order_by(func.ts_rank(PubMed.search_vector, query).desc())
 
     if filters:
         stmt = stmt.where(*filters)
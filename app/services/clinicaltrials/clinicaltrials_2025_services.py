@@ -2,7 +2,16 @@ import json
 from fastapi import FastAPI
 import requests
 import os
+import queue
+import shutil
+import threading
+from datetime import date, timedelta
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.utils.file_utils import COMPRESSION_SUFFIXES, open_text
+from app.utils.http_cache import cached_get, get_http_cache
 
 load_dotenv()
 app = FastAPI()
@@ -10,12 +19,88 @@ app = FastAPI()
 CT_BASE_URL = "https://clinicaltrials.gov/api/v2/"
 STUDIES_ENDPOINT = CT_BASE_URL + "/studies"
 PAGE_SIZE = 1000
+PREFETCH_PAGES = 2
+REQUEST_TIMEOUT = 60
+SHARDS = 8
+MAX_RETRIES = 5
+
+# Every path parse_clinicaltrials_json reads; keep in step with the parser. Requesting only
+# these instead of the whole ProtocolSection skips eligibility text, outcomes, arms and
+# full location contacts, which the parser never looks at.
+PARSER_FIELDS = (
+    "protocolSection.identificationModule.nctId",
+    "protocolSection.identificationModule.officialTitle",
+    "protocolSection.identificationModule.briefTitle",
+    "protocolSection.identificationModule.organization.fullName",
+    "protocolSection.sponsorCollaboratorsModule.leadSponsor.name",
+    "protocolSection.sponsorCollaboratorsModule.collaborators.name",
+    "protocolSection.descriptionModule.briefSummary",
+    "protocolSection.conditionsModule.conditions",
+    "protocolSection.conditionsModule.keywords",
+    "protocolSection.designModule.studyType",
+    "protocolSection.designModule.phases",
+    "protocolSection.contactsLocationsModule.locations.city",
+    "protocolSection.contactsLocationsModule.locations.state",
+    "protocolSection.contactsLocationsModule.locations.zip",
+    "protocolSection.contactsLocationsModule.locations.country",
+    "protocolSection.referencesModule.references.pmid",
+    "protocolSection.statusModule.overallStatus",
+    "protocolSection.statusModule.startDateStruct.date",
+    "protocolSection.statusModule.completionDateStruct.date",
+    "protocolSection.statusModule.lastUpdatePostDateStruct.date",
+)
 
 def clinicaltrials_fetch_batches(
         date_range: tuple[str, str] | None = None,
         pageSize: int = PAGE_SIZE,
         max_count: int | None = None,
+        prefetch: bool = True,
+        shards: int = 1,
+        extra_fields: list[str] | None = None,
 ):
+    # Pages come from a background thread on one keep-alive session, so the next page is
+    # already downloading while the caller parses the current one.
+    # shards > 1 splits the date range into disjoint sub-ranges, each walking its own
+    # nextPageToken chain on its own thread; pages are yielded in arrival order.
+    # Only PARSER_FIELDS are requested, plus any extra_fields the caller needs.
+    fields = list(dict.fromkeys([*PARSER_FIELDS, *(extra_fields or [])]))
+    if shards > 1:
+        sources = [clinicaltrials_fetch_pages(sub_range, pageSize, max_count, fields) for sub_range in split_date_range(date_range, shards)]
+        pages = prefetched(sources, PREFETCH_PAGES * len(sources))
+    elif prefetch:
+        pages = prefetched([clinicaltrials_fetch_pages(date_range, pageSize, max_count, fields)], PREFETCH_PAGES)
+    else:
+        pages = clinicaltrials_fetch_pages(date_range, pageSize, max_count, fields)
+
+    total_fetched = 0
+    for data in pages:
+        yield data
+        if max_count is not None:
+            total_fetched += len(data.get("studies", []))
+            if total_fetched >= max_count:
+                break
+
+def split_date_range(date_range, shards):
+    # Disjoint inclusive (start, end) ISO date ranges, as even as whole days allow
+    start, end = date_range or ("2025-01-01", "2025-12-31")
+    start, end = date.fromisoformat(start), date.fromisoformat(end)
+    days = (end - start).days + 1
+    shards = max(1, min(shards, days))
+    bounds = [start + timedelta(days=days * i // shards) for i in range(shards + 1)]
+    return [(a.isoformat(), (b - timedelta(days=1)).isoformat()) for a, b in zip(bounds, bounds[1:])]
+
+def clinicaltrials_session():
+    # keep-alive session that backs off on 429 / 5xx, honouring Retry-After
+    session = requests.Session()
+    retry = Retry(
+        total=MAX_RETRIES, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"], raise_on_status=False,
+    )
+    session.mount("https://", HTTPAdapter(max_retries=retry))
+    session.mount("http://", HTTPAdapter(max_retries=retry))
+    return session
+
+def clinicaltrials_fetch_pages(date_range, pageSize, max_count, fields=PARSER_FIELDS):
     if date_range:
         start, end = date_range
     else:
@@ -25,31 +110,77 @@ def clinicaltrials_fetch_batches(
     params = {
         "format": "json",
         "query.term": term,
-        "fields": "ProtocolSection",
+        "fields": "|".join(fields),
         "pageSize": pageSize,
     }
 
     page_token = None
     total_fetched = 0
-    while True:
-        if page_token:
-            params["pageToken"] = page_token
-        elif "pageToken" in params:
-            del params["pageToken"]
+    with clinicaltrials_session() as session:
+        while True:
+            if page_token:
+                params["pageToken"] = page_token
+            elif "pageToken" in params:
+                del params["pageToken"]
 
-        r = requests.get(STUDIES_ENDPOINT, params=params)
-        r.raise_for_status()
+            # served from the on-disk cache when HTTP_CACHE_DIR is set
+            data = json.loads(cached_get(STUDIES_ENDPOINT, params=params, cache=get_http_cache(), session=session, timeout=REQUEST_TIMEOUT))
+            yield data
 
-        data = r.json()
-        yield data
+            if max_count is not None:
+                total_fetched += len(data.get("studies", []))
+                if total_fetched >= max_count:
+                    break
 
-        if max_count is not None:
-            total_fetched += len(data.get("studies", []))
-            if total_fetched >= max_count:
-                break
+            page_token = data.get("nextPageToken")
+            if not page_token: break
+
+def prefetched(sources, depth):
+    # Runs each generator in `sources` on its own daemon thread, feeding one queue at most
+    # `depth` items ahead of the consumer. Errors are re-raised in the consumer; closing
+    # early stops the producers.
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
 
-        page_token = data.get("nextPageToken")
-        if not page_token: break
+    def produce(items):
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                put((item, None))
+        except Exception as e:
+            put((None, e))
+        finally:
+            if hasattr(items, "close"):
+                items.close()
+            put((done, None))
+
+    threads = [threading.Thread(target=produce, args=(items,), daemon=True) for items in sources]
+    for thread in threads:
+        thread.start()
+    running = len(threads)
+    try:
+        while running:
+            item, error = buffer.get()
+            if error is not None:
+                raise error
+            if item is done:
+                running -= 1
+                continue
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
 
 def parse_clinicaltrials_json(cts: dict):
     def clean_text(x):
@@ -121,26 +252,47 @@ def parse_date(date_str: str):
     day = split[2].zfill(2) if len(split) > 2  else "01"
     return f"{year}-{month}-{day}"
 
-def export_year(year: int):
+def export_year(year: int, compression: str | None = None, shards: int = SHARDS):
+    # compression="gzip" or "zstd" writes clinicaltrials_<year>.jsonl.gz / .jsonl.zst
+    # shards date sub-ranges of the year are harvested concurrently; each shard's rows are
+    # spooled to their own file and joined in shard order, so every run writes the same order
     #script_dir = os.path.dirname(os.path.abspath(__file__))
     OUTPUT_FOLDER = os.getenv("OUTPUT_CT_DIR")
     os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-    OUTPUT_FILE = f"clinicaltrials_{year}.jsonl"
+    OUTPUT_FILE = f"clinicaltrials_{year}.jsonl{COMPRESSION_SUFFIXES[compression]}"
     full_path = os.path.join(OUTPUT_FOLDER, OUTPUT_FILE)
 
-    start, end = f"{year}-01-01", f"{year}-12-31"
-    all_trials = []
-    for batch in clinicaltrials_fetch_batches(date_range=(start, end)):
-        parsed_trials = parse_clinicaltrials_json(batch)
-        all_trials.extend(parsed_trials)
-        print(f"Processed {len(parsed_trials)} trials (Total so far: {len(all_trials)})")
+    # rows are written as each page is parsed; the .part file is renamed once the year is complete
+    ranges = split_date_range((f"{year}-01-01", f"{year}-12-31"), shards)
+    spool_paths = [f"{full_path}.shard{i}.part" for i in range(len(ranges))]
+    sources = [shard_pages(i, sub_range) for i, sub_range in enumerate(ranges)]
+    total = 0
+    spools = [open(path, "w", encoding="utf-8") for path in spool_paths]
+    try:
+        for i, batch in prefetched(sources, PREFETCH_PAGES * len(sources)):
+            parsed_trials = parse_clinicaltrials_json(batch)
+            for trial in parsed_trials:
+                spools[i].write(json.dumps(trial, ensure_ascii=False) + "\n")
+            total += len(parsed_trials)
+            print(f"Processed {len(parsed_trials)} trials (Total so far: {total})")
+    finally:
+        for spool in spools:
+            spool.close()
 
-    with open(full_path, "w", encoding="utf-8") as f:
-        for trial in all_trials:
-            f.write(json.dumps(trial, ensure_ascii=False) + "\n")
+    with open_text(full_path + ".part", "w", compression) as f:
+        for path in spool_paths:
+            with open(path, "r", encoding="utf-8") as spool:
+                shutil.copyfileobj(spool, f)
+            os.remove(path)
+    os.replace(full_path + ".part", full_path)
 
     print(f"All trials for {year} exported to {full_path}")
 
+def shard_pages(index, date_range):
+    # (shard index, page) for every page of one date sub-range, in page order
+    for page in clinicaltrials_fetch_pages(date_range, PAGE_SIZE, None):
+        yield index, page
+
 if __name__ == "__main__":
     for year in range(2015, 2021):
         export_year(year)
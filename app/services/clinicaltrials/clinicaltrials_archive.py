@@ -0,0 +1,92 @@
+import os
+import json
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+from app.services.clinicaltrials.clinicaltrials_2025_services import parse_clinicaltrials_json
+from app.utils.file_utils import COMPRESSION_SUFFIXES, open_text
+
+load_dotenv()
+OUTPUT_CT_DIR = os.getenv("OUTPUT_CT_DIR")
+CT_ARCHIVE_PATH = os.getenv("CT_ARCHIVE_PATH")
+CHUNK_SIZE = 1000
+
+# one open ZipFile per worker process, reused across chunks
+open_archives = {}
+
+def ingest_clinicaltrials_archive(zip_path=CT_ARCHIVE_PATH, output_dir=OUTPUT_CT_DIR, workers=None, chunk_size=CHUNK_SIZE, compression=None, load_db=False):
+    # Rebuilds clinicaltrials_<year>.jsonl (year of last_update_post_date, as export_year
+    # writes them) from the ClinicalTrials.gov all-studies ZIP (one JSON file per study)
+    # without extracting it. Workers each open the archive themselves, so inflating,
+    # json.loads and parse_clinicaltrials_json all run in parallel; the main process only
+    # lists entries and writes rows, in archive order.
+    workers = workers or os.cpu_count()
+    os.makedirs(output_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_path) as archive:
+        names = [info.filename for info in archive.infolist() if info.filename.endswith(".json") and not info.is_dir()]
+    chunks = [names[i:i + chunk_size] for i in range(0, len(names), chunk_size)]
+    print(f"{len(names)} studies in {zip_path}, {len(chunks)} chunks")
+
+    suffix = ".jsonl" + COMPRESSION_SUFFIXES[compression]
+    writers = {}
+    paths = {}
+    total = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # a bounded window of chunks in flight keeps parsed rows from piling up
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(parse_archive_chunk, zip_path, chunk))
+                if len(pending) >= workers * 2:
+                    total += write_trials(pending.popleft().result(), output_dir, suffix, compression, writers, paths)
+            while pending:
+                total += write_trials(pending.popleft().result(), output_dir, suffix, compression, writers, paths)
+                print(f"{total} trials written")
+    finally:
+        for f in writers.values():
+            f.close()
+
+    for year, path in sorted(paths.items()):
+        os.replace(path + ".part", path)
+    print(f"Wrote {total} trials to {len(paths)} files in {output_dir}")
+
+    if load_db:
+        # imported here so a JSONL-only rebuild does not need DATABASE_URL
+        from app.services.clinicaltrials.clinicaltrials_loader import load_clinicaltrials_jsonl
+        for year, path in sorted(paths.items()):
+            print(f"Loading {path}")
+            load_clinicaltrials_jsonl(path)
+    return total
+
+
+def parse_archive_chunk(zip_path, names):
+    archive = open_archives.get(zip_path)
+    if archive is None:
+        archive = open_archives[zip_path] = zipfile.ZipFile(zip_path)
+    studies = []
+    for name in names:
+        try:
+            studies.append(json.loads(archive.read(name)))
+        except (ValueError, zipfile.BadZipFile) as e:
+            print(f"Skipping {name}: {e}")
+    return parse_clinicaltrials_json({"studies": studies})
+
+
+def write_trials(trials, output_dir, suffix, compression, writers, paths):
+    for trial in trials:
+        updated = trial["last_update_post_date"]
+        year = updated[:4] if updated else "unknown"
+        f = writers.get(year)
+        if f is None:
+            paths[year] = os.path.join(output_dir, f"clinicaltrials_{year}{suffix}")
+            f = writers[year] = open_text(paths[year] + ".part", "w", compression)
+        f.write(json.dumps(trial, ensure_ascii=False) + "\n")
+    return len(trials)
+
+
+if __name__ == "__main__":
+    # Full rebuild from https://clinicaltrials.gov/api/v2/studies/download?format=json.zip
+    # python -m app.services.clinicaltrials.clinicaltrials_archive
+    ingest_clinicaltrials_archive()
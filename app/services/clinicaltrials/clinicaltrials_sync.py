@@ -0,0 +1,142 @@
+import os
+import re
+import json
+from datetime import date, datetime, timezone
+from dotenv import load_dotenv
+
+from app.services.clinicaltrials.clinicaltrials_2025_services import clinicaltrials_fetch_batches, parse_clinicaltrials_json
+from app.services.clinicaltrials.nct_index import NctIndex
+from app.utils.file_utils import COMPRESSION_SUFFIXES, detect_compression, iter_records, load_json_state, open_text, save_json_state
+
+load_dotenv()
+OUTPUT_CT_DIR = os.getenv("OUTPUT_CT_DIR")
+STATE_FILENAME = "clinicaltrials_sync_state.json"
+# deltas are kept apart from the year exports, which the cache jobs and merges read
+DELTA_DIRNAME = "deltas"
+# export_year / archive outputs: clinicaltrials_<year>.jsonl, optionally .gz / .zst
+YEAR_FILE_PATTERN = re.compile(r"^clinicaltrials_(\d{4}|unknown)\.jsonl(\.gz|\.zst)?$")
+
+def sync_clinicaltrials(output_dir=OUTPUT_CT_DIR, state_path=None, since=None, until=None, load_db=True, shards=1, compression=None, delta_dir=None):
+    # Pulls only studies whose LastUpdatePostDate is on or after the stored watermark (the
+    # newest last_update_post_date seen so far), writes them to
+    # <delta_dir>/clinicaltrials_delta_<since>_<until>.jsonl (delta_dir defaults to
+    # <output_dir>/deltas), merges them into the year exports and
+    # upserts them into Postgres. The watermark day itself is fetched again because the API
+    # filter is day-granular; merge and upsert are both by nct_id, so that is harmless. The
+    # watermark only advances once the delta is merged and loaded, so a failed run just
+    # repeats. compression applies to year files the merge has to create.
+    state_path = state_path or os.path.join(output_dir, STATE_FILENAME)
+    state = load_json_state(state_path, {})
+    since = since or state.get("watermark") or initial_watermark(output_dir)
+    if since is None:
+        raise ValueError(f"No watermark in {state_path} and no exports in {output_dir}; pass since='YYYY-MM-DD'")
+    until = until or date.today().isoformat()
+
+    delta_dir = delta_dir or os.path.join(output_dir, DELTA_DIRNAME)
+    os.makedirs(delta_dir, exist_ok=True)
+    delta_path = os.path.join(delta_dir, f"clinicaltrials_delta_{since.replace('-', '')}_{until.replace('-', '')}.jsonl")
+    watermark = since
+    count = 0
+    with open(delta_path + ".part", "w", encoding="utf-8") as f:
+        for batch in clinicaltrials_fetch_batches(date_range=(since, until), shards=shards):
+            for trial in parse_clinicaltrials_json(batch):
+                f.write(json.dumps(trial, ensure_ascii=False) + "\n")
+                count += 1
+                if trial["last_update_post_date"] and trial["last_update_post_date"] > watermark:
+                    watermark = trial["last_update_post_date"]
+    os.replace(delta_path + ".part", delta_path)
+    print(f"Fetched {count} trials updated {since} to {until} into {delta_path}")
+
+    if count:
+        merge_delta(output_dir, delta_path, compression)
+
+    if load_db and count:
+        # imported here so a JSONL-only sync does not need DATABASE_URL
+        from app.services.clinicaltrials.clinicaltrials_loader import load_clinicaltrials_jsonl
+        load_clinicaltrials_jsonl(delta_path)
+
+    state.update({
+        "watermark": watermark,
+        "synced_at": datetime.now(timezone.utc).isoformat(),
+        "last_delta": {"path": os.path.relpath(delta_path, output_dir), "since": since, "until": until, "trials": count},
+    })
+    save_json_state(state_path, state)
+    print(f"Watermark now {watermark}")
+    return delta_path, count
+
+
+def merge_delta(output_dir, delta_path, compression=None):
+    # Replaces every study in the delta across the year files, so the exports read by the
+    # cache jobs stay current. Studies are bucketed by the year of last_update_post_date as
+    # export_year does; an updated study leaves its old year file and is appended to the
+    # file of its new year. The NctIndex picks the files holding older copies, so only
+    # those and the delta's own years are rewritten.
+    updates = {}
+    for trial in iter_records(delta_path):
+        updates[trial["nct_id"]] = trial
+    by_year = {}
+    for trial in updates.values():
+        updated = trial["last_update_post_date"]
+        by_year.setdefault(updated[:4] if updated else "unknown", []).append(trial)
+
+    files = year_files(output_dir)
+    with NctIndex(output_dir) as index:
+        index.refresh(files.values())
+        holding = index.files_for(updates)
+        years = {year for year, path in files.items() if os.path.basename(path) in holding} | set(by_year)
+        for year in sorted(years):
+            path = files.get(year) or os.path.join(output_dir, f"clinicaltrials_{year}.jsonl{COMPRESSION_SUFFIXES[compression]}")
+            added = by_year.get(year, [])
+            exists = os.path.exists(path)
+            file_compression = detect_compression(path) if exists else compression
+            removed = []
+            with open_text(path + ".part", "w", file_compression) as f:
+                if exists:
+                    with open_text(path) as existing:
+                        for line in existing:
+                            if not line.strip():
+                                continue
+                            nct_id = json.loads(line)["nct_id"]
+                            if nct_id in updates:
+                                removed.append(nct_id)
+                                continue
+                            f.write(line if line.endswith("\n") else line + "\n")
+                for trial in added:
+                    f.write(json.dumps(trial, ensure_ascii=False) + "\n")
+            os.replace(path + ".part", path)
+            index.replace(path, removed, [trial["nct_id"] for trial in added])
+            print(f"Merged into {os.path.basename(path)}: {len(removed)} superseded, {len(added)} written")
+
+
+def year_files(output_dir):
+    # year -> path of its export; a year written with two compressions is ambiguous
+    files = {}
+    for name in sorted(os.listdir(output_dir)):
+        match = YEAR_FILE_PATTERN.match(name)
+        if not match:
+            continue
+        year = match.group(1)
+        if year in files:
+            raise ValueError(
+                f"Year {year} has more than one export in {output_dir}: {os.path.basename(files[year])} and {name}; "
+                "remove all but one"
+            )
+        files[year] = os.path.join(output_dir, name)
+    return files
+
+
+def initial_watermark(output_dir):
+    # First sync: newest last_update_post_date across the existing year exports
+    newest = None
+    for path in year_files(output_dir).values():
+        for record in iter_records(path, columns=["last_update_post_date"]):
+            updated = record.get("last_update_post_date")
+            if updated and (newest is None or updated > newest):
+                newest = updated
+    return newest
+
+
+if __name__ == "__main__":
+    # Daily refresh
+    # python -m app.services.clinicaltrials.clinicaltrials_sync
+    sync_clinicaltrials()
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+
+from app.utils.file_utils import iter_records
+
+INDEX_FILENAME = "nct_index.sqlite"
+
+class NctIndex:
+    # nct_id -> year file name for every study in the ClinicalTrials.gov year exports, so a
+    # sync delta only opens the files that hold the studies it updates. Each file's size and
+    # mtime are recorded with its ids; refresh() rescans files that changed since (rebuilt by
+    # export_year or the archive ingest), and merges record what they rewrote themselves.
+    def __init__(self, output_dir, filename=INDEX_FILENAME):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(output_dir, filename))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS trials (
+                nct_id TEXT NOT NULL,
+                file TEXT NOT NULL,
+                PRIMARY KEY (nct_id, file)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                file TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_trials_file ON trials (file)")
+        self.conn.commit()
+
+    def refresh(self, paths):
+        # Brings the index in line with the year files at `paths`, the full current set
+        names = {os.path.basename(path): path for path in paths}
+        stamps = {file: (size, mtime_ns) for file, size, mtime_ns in self.conn.execute("SELECT file, size, mtime_ns FROM files")}
+        with self.conn:
+            for file in set(stamps) - set(names):
+                self.forget(file)
+        for file, path in sorted(names.items()):
+            if stamps.get(file) == file_stamp(path):
+                continue
+            print(f"Indexing {file}")
+            with self.conn:
+                self.forget(file)
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO trials (nct_id, file) VALUES (?, ?)",
+                    ((record["nct_id"], file) for record in iter_records(path, columns=["nct_id"]) if record["nct_id"]),
+                )
+                self.stamp(path)
+
+    def files_for(self, nct_ids):
+        nct_ids = list(nct_ids)
+        files = set()
+        for i in range(0, len(nct_ids), 500):
+            chunk = nct_ids[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT DISTINCT file FROM trials WHERE nct_id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            files.update(file for file, in rows)
+        return files
+
+    def replace(self, path, removed, added):
+        # After `path` was rewritten without the `removed` ids and with the `added` ones
+        file = os.path.basename(path)
+        with self.conn:
+            self.conn.executemany("DELETE FROM trials WHERE nct_id = ? AND file = ?", ((nct_id, file) for nct_id in removed))
+            self.conn.executemany("INSERT OR IGNORE INTO trials (nct_id, file) VALUES (?, ?)", ((nct_id, file) for nct_id in added))
+            self.stamp(path)
+
+    def forget(self, file):
+        self.conn.execute("DELETE FROM trials WHERE file = ?", (file,))
+        self.conn.execute("DELETE FROM files WHERE file = ?", (file,))
+
+    def stamp(self, path):
+        self.conn.execute(
+            "INSERT INTO files (file, size, mtime_ns) VALUES (?, ?, ?) "
+            "ON CONFLICT(file) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns",
+            (os.path.basename(path), *file_stamp(path)),
+        )
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
@@ -0,0 +1,323 @@
+import os
+import json
+import time
+import hashlib
+import random
+import asyncio
+import threading
+from collections import deque
+from dotenv import load_dotenv
+import httpx
+from lxml import etree
+
+from app.services.pubmed.dataset_pipeline.streamer import pubmed_pull_parser, read_pubmed_articles
+from app.utils.http_cache import get_http_cache
+
+load_dotenv()
+EUTILS_BASE_URL = os.getenv("EUTILS_BASE_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/")
+NCBI_API_KEY = os.getenv("NCBI_API_KEY")
+
+# NCBI allows 3 requests/s per IP, 10/s with an API key
+DEFAULT_RATE = 3
+API_KEY_RATE = 10
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+BATCH_SIZE = 1000
+FETCH_CONCURRENCY = 4
+# longer id lists go in a POST body so the URL stays short
+POST_ID_THRESHOLD = 200
+# ids uploaded per EPost call; each chunk becomes one query_key on the shared WebEnv
+EPOST_CHUNK_SIZE = 10000
+CACHED_CHUNK_SIZE = 1 << 20
+
+class TokenBucket:
+    # rate tokens/s; capacity 1 keeps requests evenly spaced so a burst never exceeds the limit
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class EutilsClient:
+    # One pooled keep-alive httpx client shared by every request, a token bucket across all
+    # of them, and retries with exponential backoff on 429/5xx and dropped connections.
+    # base_url can point at a local stand-in server for testing.
+    # With an HttpCache (HTTP_CACHE_DIR by default) repeat requests are served from disk.
+    # WebEnvs differ on every run, so history windows are cached under the search or EPost
+    # that created them instead of the WebEnv itself.
+    def __init__(self, api_key=NCBI_API_KEY, base_url=EUTILS_BASE_URL, rate=None, max_retries=MAX_RETRIES, timeout=60.0, max_connections=10, cache=None):
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.cache = cache if cache is not None else get_http_cache()
+        self.history_keys = {}
+        self.limiter = TokenBucket(rate or (API_KEY_RATE if api_key else DEFAULT_RATE))
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def request(self, endpoint, params, post=False, consume=None, cache_params=None):
+        # Body bytes, or consume(chunks) when given an async byte-chunk reader of the streamed
+        # body; a drop mid-body retries the whole request. cache_params overrides what the
+        # cache key is built from, False skips the cache.
+        method = "POST" if post else "GET"
+        key = None
+        if self.cache is not None and cache_params is not False:
+            # keyed on the absolute URL, so a mirror or stand-in never shares entries with NCBI
+            key = self.cache.key(method, str(self.client.base_url) + endpoint, params if cache_params is None else cache_params)
+        entry = self.cache.get(key) if key else None
+        if entry and entry["fresh"]:
+            return await finish_body(entry["body"], consume)
+
+        params = dict(params)
+        if self.api_key:
+            params["api_key"] = self.api_key
+        kwargs = {"data": params} if post else {"params": params}
+        if entry:
+            kwargs["headers"] = self.cache.validators(entry)
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            response = None
+            try:
+                async with self.client.stream(method, endpoint, **kwargs) as response:
+                    if entry and response.status_code == 304:
+                        self.cache.refresh(key)
+                        return await finish_body(entry["body"], consume)
+                    if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                        response.raise_for_status()
+                        writer = self.cache.writer() if key else None
+                        try:
+                            chunks = tee_chunks(response.aiter_bytes(), writer)
+                            result = await consume(chunks) if consume is not None else b"".join([c async for c in chunks])
+                        except BaseException:
+                            if writer is not None:
+                                writer.discard()
+                            raise
+                        if writer is not None:
+                            self.cache.commit(key, str(response.url), writer, response.headers)
+                        return result
+                print(f"{endpoint} attempt {attempt + 1} got HTTP {response.status_code}")
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"{endpoint} attempt {attempt + 1} failed: {e!r}")
+            await asyncio.sleep(backoff_delay(attempt, response))
+
+    async def esearch(self, term, retmax=0, retstart=0, usehistory=True, **extra):
+        params = {"db": "pubmed", "term": term, "retmode": "json", "retmax": retmax, "retstart": retstart, **extra}
+        if usehistory:
+            params["usehistory"] = "y"
+        # a history search has to run live to get a usable WebEnv
+        body = await self.request("esearch.fcgi", params, cache_params=False if usehistory else None)
+        result = json.loads(body).get("esearchresult", {})
+        if "ERROR" in result:
+            raise ValueError(f"esearch failed for {term!r}: {result['ERROR']}")
+        if usehistory:
+            self.history_keys[(result.get("webenv"), result.get("querykey"))] = json.dumps(sorted(params.items()))
+        return {
+            "count": int(result.get("count", 0)),
+            "webenv": result.get("webenv"),
+            "query_key": result.get("querykey"),
+            "ids": result.get("idlist", []),
+        }
+
+    async def efetch(self, ids=None, webenv=None, query_key=None, retstart=0, retmax=BATCH_SIZE, parse=False, fields=None):
+        # PubmedArticleSet for an id list or a window of a history query: raw XML bytes, or with
+        # parse=True the article dicts from the baseline extractor, parsed as the body streams in
+        params = {"db": "pubmed", "rettype": "xml", "retmode": "xml"}
+        cache_params = None
+        if ids is not None:
+            params["id"] = ",".join(str(pmid) for pmid in ids)
+        else:
+            params.update({"WebEnv": webenv, "query_key": query_key, "retstart": retstart, "retmax": retmax})
+            history = self.history_keys.get((webenv, query_key))
+            cache_params = {**params, "WebEnv": history, "query_key": None} if history else False
+        post = ids is not None and len(ids) > POST_ID_THRESHOLD
+
+        if not parse:
+            return await self.request("efetch.fcgi", params, post=post, cache_params=cache_params)
+
+        async def consume(chunks):
+            parser = pubmed_pull_parser()
+            articles = []
+            async for chunk in chunks:
+                parser.feed(chunk)
+                articles.extend(read_pubmed_articles(parser, fields))
+            parser.close()
+            articles.extend(read_pubmed_articles(parser, fields))
+            return articles
+
+        return await self.request("efetch.fcgi", params, post=post, consume=consume, cache_params=cache_params)
+
+    async def epost(self, ids, webenv=None):
+        # Uploads ids to the history server; passing webenv appends them to that session
+        params = {"db": "pubmed", "id": ",".join(str(pmid) for pmid in ids)}
+        if webenv:
+            params["WebEnv"] = webenv
+        body = await self.request("epost.fcgi", params, post=True, cache_params=False)
+        root = etree.fromstring(body)
+        error = root.findtext("ERROR")
+        if error or root.findtext("WebEnv") is None:
+            raise ValueError(f"epost failed: {error or body[:200]!r}")
+        posted = {"webenv": root.findtext("WebEnv"), "query_key": root.findtext("QueryKey")}
+        self.history_keys[(posted["webenv"], posted["query_key"])] = "epost:" + hashlib.sha256(params["id"].encode()).hexdigest()
+        return posted
+
+    async def efetch_history(self, webenv, query_key, count, batch_size=BATCH_SIZE, concurrency=FETCH_CONCURRENCY, parse=False, fields=None):
+        # Yields (retstart, batch) in order while up to `concurrency` windows are in flight;
+        # the token bucket still spaces out when each request starts.
+        windows = [(webenv, query_key, retstart, min(batch_size, count - retstart)) for retstart in range(0, count, batch_size)]
+        async for window, batch in self.fetch_windows(windows, concurrency, parse, fields):
+            yield window[2], batch
+
+    async def efetch_bulk(self, ids, batch_size=BATCH_SIZE, concurrency=FETCH_CONCURRENCY, parse=True, fields=None):
+        # Any number of PMIDs: EPost them in chunks onto one WebEnv, then pull every chunk's
+        # windows from the history server in parallel. Yields one batch per window, in order.
+        ids = list(dict.fromkeys(str(pmid).strip() for pmid in ids if str(pmid).strip()))
+        windows = []
+        webenv = None
+        for start in range(0, len(ids), EPOST_CHUNK_SIZE):
+            chunk = ids[start:start + EPOST_CHUNK_SIZE]
+            posted = await self.epost(chunk, webenv)
+            webenv = posted["webenv"]
+            windows.extend(
+                (webenv, posted["query_key"], retstart, min(batch_size, len(chunk) - retstart))
+                for retstart in range(0, len(chunk), batch_size)
+            )
+        async for _, batch in self.fetch_windows(windows, concurrency, parse, fields):
+            yield batch
+
+    async def fetch_windows(self, windows, concurrency=FETCH_CONCURRENCY, parse=False, fields=None):
+        # (webenv, query_key, retstart, retmax) windows, at most `concurrency` in flight
+        pending = deque()
+        try:
+            for window in windows:
+                webenv, query_key, retstart, retmax = window
+                pending.append((window, asyncio.create_task(self.efetch(
+                    webenv=webenv, query_key=query_key, retstart=retstart, retmax=retmax, parse=parse, fields=fields,
+                ))))
+                if len(pending) >= concurrency:
+                    done, task = pending.popleft()
+                    yield done, await task
+            while pending:
+                done, task = pending.popleft()
+                yield done, await task
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+class SyncEutilsClient:
+    # Blocking wrapper for sync callers. One EutilsClient lives on an event loop in a daemon
+    # thread, so connections and the rate limit carry over between calls, and efetch_history
+    # windows keep downloading while the caller is busy with the previous batch.
+    def __init__(self, **client_kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.client = EutilsClient(**client_kwargs)
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def esearch(self, term, **kwargs):
+        return self.run(self.client.esearch(term, **kwargs))
+
+    def efetch(self, ids=None, **kwargs):
+        return self.run(self.client.efetch(ids, **kwargs))
+
+    def epost(self, ids, webenv=None):
+        return self.run(self.client.epost(ids, webenv))
+
+    def efetch_history(self, webenv, query_key, count, **kwargs):
+        return self.iterate(self.client.efetch_history(webenv, query_key, count, **kwargs))
+
+    def efetch_bulk(self, ids, **kwargs):
+        return self.iterate(self.client.efetch_bulk(ids, **kwargs))
+
+    def iterate(self, batches):
+        try:
+            while True:
+                try:
+                    yield self.run(batches.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            self.run(batches.aclose())
+
+    def close(self):
+        self.run(self.client.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def tee_chunks(chunks, writer=None):
+    async for chunk in chunks:
+        if writer is not None:
+            writer.write(chunk)
+        yield chunk
+
+
+async def finish_body(body, consume=None):
+    # a cached body, handed over the same way as a live one
+    if consume is None:
+        return body
+
+    async def chunks():
+        for start in range(0, len(body), CACHED_CHUNK_SIZE):
+            yield body[start:start + CACHED_CHUNK_SIZE]
+
+    return await consume(chunks())
+
+
+def backoff_delay(attempt, response=None):
+    # honour a numeric Retry-After, otherwise exponential with jitter
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), BACKOFF_MAX)
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+def get_sync_client():
+    # process-wide client, so every sync caller shares one connection pool and one rate limit
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = SyncEutilsClient()
+        return _shared_client
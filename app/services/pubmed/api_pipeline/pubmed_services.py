@@ -1,146 +1,56 @@
 from fastapi import FastAPI
-import xmltodict, json
-import requests
+import json
 
-app = FastAPI()
+from app.services.pubmed.api_pipeline.eutils_client import POST_ID_THRESHOLD, get_sync_client
+from app.services.pubmed.dataset_pipeline.pubmed_2025_services import (
+    MAX_WINDOW_RECORDS,
+    entrez_date_term,
+    pubmed_fetch_batches,
+    pubmed_query_batches,
+    split_entrez_dates,
+)
 
-PUBMED_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-ESEARCH_ENDPOINT = PUBMED_BASE_URL + "esearch.fcgi"
-EFETCH_ENDPOINT = PUBMED_BASE_URL + "efetch.fcgi"
-ESUMMARY_ENDPOINT = PUBMED_BASE_URL + "esummary.fcgi"
+app = FastAPI()
 
 def search(term: str, max_results: int = 5000, field_type: str = None):
     query = f"{term}[{field_type}]" if field_type else term
-    params = {
-        "db": "pubmed",
-        "term": query,
-        "retmode": "json",
-        "retmax": max_results
-    }
-    r = requests.get(ESEARCH_ENDPOINT, params=params)
-    r.raise_for_status()
-    return r.json().get("esearchresult", {}).get("idlist", [])
+    return get_sync_client().esearch(query, retmax=max_results, usehistory=False)["ids"]
 
-def fetch_pubmed_metadata(pmids: list[str]):
+def fetch_pubmed_metadata(pmids: list[str], fields: list[str] | None = None):
+    # Article dicts in the baseline export schema, stream-parsed from the efetch response.
+    # Past a few hundred PMIDs the list goes through EPost and the history server instead.
     if not pmids:
         return []
-    params = {
-        "db": "pubmed",
-        "id": ",".join(pmids),
-        "retmode": "xml"
-    }
-    r = requests.get(EFETCH_ENDPOINT, params=params)
-    r.raise_for_status()
-    return xmltodict.parse(r.text)
-
-def parse_pubmed_xml_to_json(xml_data: dict):
-    articles = xml_data.get("PubmedArticleSet", {}).get("PubmedArticle", [])
-    if isinstance(articles, dict):
-        articles = [articles]
-    filtered = []
-
-    for article in articles:
-        citation = article.get("MedlineCitation", {})
-        pmid = citation.get("PMID", {}).get("#text", "")
-        if not pmid: continue
-        pubmed_data = article.get("PubmedData", {})
-        date_data = pubmed_data.get("History", {}).get("PubMedPubDate", {})
-        if isinstance(date_data, dict):
-            date_data = [date_data]
-        date_published = None
-        for date in date_data:
-            if date.get("@PubStatus") == "pubmed":
-                date_published = date
-                break
-
-        article_data = citation.get("Article", {})
-        title = article_data.get("ArticleTitle", "")
-        abstract_raw = article_data.get("Abstract", {}).get("AbstractText", "")
-        if isinstance(abstract_raw, dict):
-            abstract_text = abstract_raw.get("#text", "")
-        elif isinstance(abstract_raw, list):
-            abstract_text = " ".join(a.get("#text", "") if isinstance(a, dict) else str(a) for a in abstract_raw).strip()
-        else:
-            abstract_text = abstract_raw
-
-        authors = []
-        author_list = article_data.get("AuthorList", {}).get("Author", [])
-        if isinstance(author_list, dict):
-            author_list = [author_list]
-        for author in author_list:
-            last_name = author.get("LastName", "")
-            fore_name = author.get("ForeName", "")
-            full_name = f"{fore_name} {last_name}".strip()
-
-            aff_info = author.get("AffiliationInfo", [])
-            if isinstance(aff_info, dict):
-                aff_info = [aff_info]
-
-            author_affiliations = []
-            for aff in aff_info:
-                aff_text = aff.get("Affiliation", "")
-                if aff_text and "contributed equally" not in aff_text.lower():
-                    author_affiliations.append(aff_text.strip())
-
-            authors.append({
-                "name": full_name,
-                "affiliations": author_affiliations
-            })
-
-        journal_title = article_data.get("Journal", {}).get("Title", "")
-        language = article_data.get("Language", "")
-
-        pub_type_raw = article_data.get("PublicationTypeList", {}).get("PublicationType", [])
-        if isinstance(pub_type_raw, dict):
-            pub_types = [pub_type_raw.get("#text", "").strip()]
-        elif isinstance(pub_type_raw, list):
-            pub_types = [(p.get("#text", "") if isinstance(p, dict) else str(p)).strip() for p in pub_type_raw]
-        else:
-            pub_types = []
-        pub_type = pub_types
-
-        mesh_list = citation.get("MeshHeadingList", {}).get("MeshHeading", [])
-        if isinstance(mesh_list, dict):
-            mesh_list = [mesh_list]
-
-        mesh_terms = []
-        for mesh in mesh_list:
-            descriptor = mesh.get("DescriptorName", {})
-            if isinstance(descriptor, dict):
-                term = descriptor.get("#text", "")
-            else:
-                term = str(descriptor)
-            
-            if term:
-                mesh_terms.append(term)
-
-        filtered.append({
-            "pmid": pmid,
-            "publication_type": pub_type,
-            "title": title,
-            "journal_title": journal_title,
-            "authors": authors,
-            "abstract": abstract_text,
-            "mesh_terms": mesh_terms,
-            "date_published": parse_date(date_published),
-            "language": language,
-        })
-
-    return filtered
-
-def parse_date(date_dict: dict):
-    if not date_dict: return None
-    year = date_dict.get("Year")
-    if not year: return None
-    
-    month = date_dict.get("Month", "01").zfill(2)
-    day = date_dict.get("Day", "01").zfill(2)
-    return f"{year}-{month}-{day}"
+    if len(pmids) <= POST_ID_THRESHOLD:
+        return get_sync_client().efetch(pmids, parse=True, fields=fields)
+    return [article for batch in iter_pubmed_metadata(pmids, fields) for article in batch]
+
+def iter_pubmed_metadata(pmids: list[str], fields: list[str] | None = None):
+    # Bulk mode for large PMID lists (e.g. every trial reference_pmid): one list of articles
+    # per efetch window, fetched in parallel, so 100k+ PMIDs never sit in memory at once
+    yield from get_sync_client().efetch_bulk(pmids, fields=fields)
+
+def search_pubmed_metadata(term: str, field_type: str = None, fields: list[str] | None = None):
+    # Every match for a query, not capped by esearch retmax: fetched from the history server.
+    # Past the 9,999 records one history search can page through, the query is split into
+    # Entrez date ranges and each range is searched and fetched on its own.
+    query = f"{term}[{field_type}]" if field_type else term
+    result = get_sync_client().esearch(query)
+    if result["count"] <= MAX_WINDOW_RECORDS:
+        yield from pubmed_fetch_batches(result["webenv"], result["query_key"], result["count"], fields)
+        return
+
+    ranges = split_entrez_dates(query, result["count"])
+    too_large = [(start, end, n) for start, end, n in ranges if n > MAX_WINDOW_RECORDS]
+    if too_large:
+        start, end, n = too_large[0]
+        raise ValueError(f"{query!r} has {n} records entered on {start}, more than one history search can page through")
+    for start, end, _ in ranges:
+        yield from pubmed_query_batches(entrez_date_term(query, start, end), fields)
 
 if __name__ == "__main__":
     search_term = "Diabetes"
     pmids = search(search_term, 5)
     #pmids = search(search_term, 5, "Author")
-    xml_data = fetch_pubmed_metadata(pmids)
-    parsed_data = parse_pubmed_xml_to_json(xml_data)
+    parsed_data = fetch_pubmed_metadata(pmids)
     print(json.dumps(parsed_data, indent=2))
\ No newline at end of file
@@ -0,0 +1,58 @@
+import os
+import json
+import time
+from dotenv import load_dotenv
+from lxml import etree
+
+from app.services.pubmed.dataset_pipeline.parser import extract_pubmed_article, parse_pubmed_article
+from app.services.pubmed.dataset_pipeline.streamer import gzip_backend, stream_pubmed_gz
+
+load_dotenv()
+LOCAL_BASELINE_DIR = os.getenv("LOCAL_BASELINE_DIR")
+
+def time_stream(path, prefetch):
+    start = time.perf_counter()
+    count = 0
+    for elem in stream_pubmed_gz(path, prefetch=prefetch):
+        article = extract_pubmed_article(elem)
+        if article is None:
+            continue
+        json.dumps(article, ensure_ascii=False)
+        count += 1
+    return time.perf_counter() - start, count
+
+def bench_stream(input_dir, max_files=3):
+    # Decompress + parse + JSON encode per file, inline vs. background-thread inflate
+    print(f"gzip backend: {gzip_backend.__name__}")
+    filenames = sorted(f for f in os.listdir(input_dir) if f.endswith(".xml.gz"))[:max_files]
+    for filename in filenames:
+        path = os.path.join(input_dir, filename)
+        serial, count = time_stream(path, prefetch=False)
+        prefetch, _ = time_stream(path, prefetch=True)
+        print(f"{filename}: {count} articles, serial {serial:.2f}s, prefetch {prefetch:.2f}s ({serial / prefetch:.2f}x)")
+
+def bench_parser(input_dir, max_articles=50000, rounds=3):
+    # Articles/sec of the find()-based parser vs. the single-pass extractor on the same elements
+    filename = sorted(f for f in os.listdir(input_dir) if f.endswith(".xml.gz"))[0]
+    with gzip_backend.open(os.path.join(input_dir, filename), "rb") as f:
+        root = etree.parse(f, etree.XMLParser(recover=True)).getroot()
+    elems = root.findall("PubmedArticle")[:max_articles]
+
+    for elem in elems:
+        if parse_pubmed_article(elem) != extract_pubmed_article(elem):
+            raise ValueError(f"Extractor mismatch for {etree.tostring(elem)[:200]}")
+
+    for parse in (parse_pubmed_article, extract_pubmed_article):
+        best = min(time_parse(parse, elems) for _ in range(rounds))
+        print(f"{parse.__name__}: {len(elems) / best:,.0f} articles/sec")
+
+def time_parse(parse, elems):
+    start = time.perf_counter()
+    for elem in elems:
+        parse(elem)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    # python -m app.services.pubmed.dataset_pipeline.benchmark
+    bench_parser(LOCAL_BASELINE_DIR)
+    bench_stream(LOCAL_BASELINE_DIR)
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from dotenv import load_dotenv
+
+from app.db.bulk import COPY_CHUNK_ROWS, copy_upsert, create_staging, drop_staging, stage_rows, worker_engine
+from app.db.models import PubMed
+from app.services.pubmed.dataset_pipeline.exporter import pubmed_file_index
+from app.services.pubmed.dataset_pipeline.streamer import stream_pubmed_articles
+from app.services.pubmed.pubmed_loader import merge_pubmed_partition, pubmed_row
+from app.utils.file_utils import COMPRESSION_SUFFIXES, open_text
+
+load_dotenv()
+LOCAL_BASELINE_DIR = os.getenv("LOCAL_BASELINE_DIR")
+SINK_BATCH_ROWS = 1000
+SINK_QUEUE_BATCHES = 16
+
+def load_pubmed_xml(input_dir=LOCAL_BASELINE_DIR, starting_index=1, workers=1, prefetch=True, tee_dir=None, compression=None, chunk_size=COPY_CHUNK_ROWS):
+    # Loads baseline .xml.gz files straight into the pubmed table: parsed articles go to a
+    # COPY writer thread through a bounded queue, with no JSONL written and read back.
+    # tee_dir additionally keeps <file>.jsonl (or .jsonl.gz / .jsonl.zst) per source file.
+    # With workers > 1 files are staged in parallel and merged by pmid, later files winning,
+    # as load_pubmed_dir does; with one worker files are upserted in order.
+    filenames = []
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.endswith(".gz"):
+            continue
+        idx = pubmed_file_index(filename)
+        if idx is None or idx < starting_index:
+            continue
+        filenames.append(filename)
+    if tee_dir:
+        os.makedirs(tee_dir, exist_ok=True)
+    print(f"Loading {len(filenames)} files from {input_dir} with {workers} workers")
+
+    start = time.time()
+    if workers <= 1:
+        parsed = written = 0
+        for filename in filenames:
+            file_parsed, file_written = load_pubmed_xml_file(os.path.join(input_dir, filename), filename, prefetch, tee_dir, compression, chunk_size)
+            parsed += file_parsed
+            written += file_written
+    else:
+        staging = create_staging(PubMed.__table__)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(load_pubmed_xml_file, os.path.join(input_dir, filename), filename, prefetch, tee_dir, compression, chunk_size, staging)
+                    for filename in filenames
+                ]
+                parsed = sum(future.result()[0] for future in futures)
+                written = sum(executor.map(merge_pubmed_partition, repeat(staging), range(workers), repeat(workers)))
+        finally:
+            drop_staging(staging)
+
+    seconds = time.time() - start
+    print(f"Parsed {parsed} articles, wrote {written} new or changed pmids in {seconds:.1f}s ({parsed / max(seconds, 1e-9):.0f} rows/s)")
+    return written
+
+
+def load_pubmed_xml_file(local_path, filename, prefetch=True, tee_dir=None, compression=None, chunk_size=COPY_CHUNK_ROWS, staging=None):
+    # (articles parsed, rows written); with staging set, rows are staged under the file's
+    # index for a later merge instead of upserted
+    if staging is None:
+        def sink(rows):
+            return copy_upsert(PubMed.__table__, rows, chunk_size)
+    else:
+        def sink(rows):
+            return stage_rows(PubMed.__table__, staging, rows, pubmed_file_index(filename), chunk_size, bind=worker_engine())
+
+    print(f"Processing {filename}...")
+    articles = stream_pubmed_articles(local_path, prefetch=prefetch)
+    if not tee_dir:
+        return stream_to_sink(articles, sink)
+
+    tee_path = os.path.join(tee_dir, filename.replace(".xml.gz", ".jsonl" + COMPRESSION_SUFFIXES[compression]))
+    with open_text(tee_path + ".part", "w", compression) as tee:
+        result = stream_to_sink(articles, sink, tee)
+    os.replace(tee_path + ".part", tee_path)
+    return result
+
+
+def stream_to_sink(articles, sink, tee=None):
+    # Runs sink(rows) on a writer thread fed in batches through a bounded queue, so parsing
+    # continues while COPY waits on the database and blocks once it is SINK_QUEUE_BATCHES
+    # ahead. Writer errors stop the parser and are re-raised here.
+    batches = queue.Queue(maxsize=SINK_QUEUE_BATCHES)
+    done = object()
+    result = {}
+
+    def rows():
+        for batch in iter(batches.get, done):
+            yield from batch
+        result["drained"] = True
+
+    def write():
+        try:
+            result["written"] = sink(rows())
+        except BaseException as e:
+            result["error"] = e
+            # keep draining so the parser never blocks on a dead writer
+            while not result.get("drained") and batches.get() is not done:
+                pass
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    parsed = 0
+    batch = []
+    try:
+        for article in articles:
+            if tee is not None:
+                tee.write(json.dumps(article, ensure_ascii=False) + "\n")
+            row = pubmed_row(article)
+            if row is None:
+                continue
+            batch.append(row)
+            parsed += 1
+            if len(batch) >= SINK_BATCH_ROWS:
+                if "error" in result:
+                    break
+                batches.put(batch)
+                batch = []
+        if batch and "error" not in result:
+            batches.put(batch)
+    finally:
+        batches.put(done)
+        writer.join()
+    if "error" in result:
+        raise result["error"]
+    return parsed, result["written"]
+
+
+if __name__ == "__main__":
+    # python -m app.services.pubmed.dataset_pipeline.db_loader
+    load_pubmed_xml(LOCAL_BASELINE_DIR, workers=os.cpu_count())
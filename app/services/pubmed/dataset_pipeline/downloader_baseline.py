@@ -1,55 +1,170 @@
 import os
 import ftplib
+import hashlib
+import queue
+import threading
 
-def download_gz_files(ftp_host, ftp_dir, local_dir):
+FTP_PORT = 21
+MAX_RETRIES = 3
+
+class ChecksumError(Exception):
+    pass
+
+def connect(ftp_host, ftp_dir, port=FTP_PORT):
+    ftp = ftplib.FTP()
+    ftp.connect(ftp_host, port)
+    ftp.login()
+    ftp.cwd(ftp_dir)
+    ftp.voidcmd("TYPE I")
+    return ftp
+
+def download_gz_files(ftp_host, ftp_dir, local_dir, workers=4, port=FTP_PORT):
+    # N worker threads, each with its own FTP connection, pull files off a shared queue.
+    # Files land as .part (resumed with REST after a drop), are checked against NCBI's
+    # published .md5 and only then renamed into place.
     os.makedirs(local_dir, exist_ok=True)
     try:
-        ftp = ftplib.FTP(ftp_host)
-        ftp.login()
-        ftp.cwd(ftp_dir)
-
+        ftp = connect(ftp_host, ftp_dir, port)
         files = ftp.nlst()
-        gz_files = [f for f in files if f.endswith(".gz")]
-        print(f"Found {len(files)} files in {ftp_dir} on {ftp_host}")
+        ftp.quit()
+    except ftplib.all_errors as e:
+        print(f"Failed to download files from {ftp_host}: {e}")
+        return None
 
-        for filename in gz_files:
-            local_path = os.path.join(local_dir, filename)
-            if os.path.exists(local_path):
-                continue
+    gz_files = [f for f in files if f.endswith(".gz")]
+    md5_files = {f for f in files if f.endswith(".gz.md5")}
+    print(f"Found {len(files)} files in {ftp_dir} on {ftp_host}")
 
-            print(f"Downloading {filename}...")
-            with open(local_path, "wb") as f:
-                ftp.retrbinary(f"RETR {filename}", f.write)
+    pending = queue.Queue()
+    for filename in gz_files:
+        pending.put(filename)
+    failed = []
 
-        ftp.quit()
+    def worker():
+        ftp = None
+        while True:
+            try:
+                filename = pending.get_nowait()
+            except queue.Empty:
+                break
+            for attempt in range(1, MAX_RETRIES + 1):
+                try:
+                    if ftp is None:
+                        ftp = connect(ftp_host, ftp_dir, port)
+                    download_verified(ftp, filename, local_dir, has_md5=f"{filename}.md5" in md5_files)
+                    break
+                except (*ftplib.all_errors, ChecksumError) as e:
+                    print(f"Attempt {attempt} failed for {filename}: {e}")
+                    close_quietly(ftp)
+                    ftp = None
+            else:
+                failed.append(filename)
+        close_quietly(ftp)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if failed:
+        print(f"Failed to download {len(failed)} files: {sorted(failed)}")
+    else:
         print("All files downloaded.")
-    except Exception as e:
-        print(f"Failed to download files from {ftp_host}: {e}")
+    return sorted(failed)
 
 
-def download_target_gz_file(ftp_host, ftp_dir, local_dir, index):
+def download_target_gz_file(ftp_host, ftp_dir, local_dir, index, port=FTP_PORT):
     os.makedirs(local_dir, exist_ok=True)
     filename = f"pubmed25n{index:04d}.xml.gz"
     local_path = os.path.join(local_dir, filename)
 
-    if os.path.exists(local_path):
+    if os.path.exists(local_path) and os.path.exists(local_path + ".md5"):
         print(f"Already exists: {filename}")
         return local_path
 
     try:
         print(f"Connecting to FTP: {ftp_host}")
-        ftp = ftplib.FTP(ftp_host)
-        ftp.login()
-        ftp.cwd(ftp_dir)
-
-        print(f"Downloading {filename}...")
-        with open(local_path, "wb") as f:
-            ftp.retrbinary(f"RETR {filename}", f.write)
-
+        ftp = connect(ftp_host, ftp_dir, port)
+        download_verified(ftp, filename, local_dir, has_md5=True)
         ftp.quit()
         print(f"Downloaded → {local_path}")
         return local_path
 
-    except Exception as e:
+    except (*ftplib.all_errors, ChecksumError) as e:
         print(f"Failed to download {filename}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def download_verified(ftp, filename, local_dir, has_md5=True):
+    local_path = os.path.join(local_dir, filename)
+    part_path = local_path + ".part"
+    md5_path = local_path + ".md5"
+
+    # a local .md5 sidecar is only written after a verified download
+    if os.path.exists(local_path) and os.path.exists(md5_path):
+        return local_path
+
+    expected = fetch_md5(ftp, filename) if has_md5 else None
+    if os.path.exists(local_path):
+        if expected is not None and file_md5(local_path) == expected:
+            write_md5(md5_path, filename, expected)
+            return local_path
+        # unverified leftover from an older run: treat it as a partial download
+        os.replace(local_path, part_path)
+
+    remote_size = ftp.size(filename)
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset > remote_size:
+        offset = 0
+    if offset < remote_size or remote_size == 0:
+        print(f"Downloading {filename}..." if offset == 0 else f"Resuming {filename} at {offset} bytes...")
+        with open(part_path, "ab" if offset else "wb") as f:
+            ftp.retrbinary(f"RETR {filename}", f.write, rest=offset or None)
+
+    size = os.path.getsize(part_path)
+    if size != remote_size:
+        raise ChecksumError(f"{filename}: got {size} bytes, expected {remote_size}")
+    if expected is not None:
+        actual = file_md5(part_path)
+        if actual != expected:
+            os.remove(part_path)
+            raise ChecksumError(f"{filename}: md5 {actual} does not match published {expected}")
+
+    os.replace(part_path, local_path)
+    if expected is not None:
+        write_md5(md5_path, filename, expected)
+    return local_path
+
+
+def fetch_md5(ftp, filename):
+    # NCBI .md5 files read "MD5(pubmed25n0001.xml.gz)= <hex digest>"
+    chunks = []
+    try:
+        ftp.retrbinary(f"RETR {filename}.md5", chunks.append)
+    except ftplib.error_perm:
+        return None
+    text = b"".join(chunks).decode("ascii", errors="replace").strip()
+    return text.split()[-1].lower() if text else None
+
+
+def write_md5(md5_path, filename, digest):
+    with open(md5_path, "w", encoding="ascii") as f:
+        f.write(f"MD5({filename})= {digest}\n")
+
+
+def file_md5(path, chunk_size=1 << 20):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def close_quietly(ftp):
+    if ftp is None:
+        return
+    try:
+        ftp.quit()
+    except ftplib.all_errors:
+        ftp.close()
@@ -20,5 +20,5 @@ if __name__ == "__main__":
     # Just run whatever is necessary
     # python -m app.services.pubmed.dataset_pipeline.etl
     # download_gz_files(FTP_HOST, FTP_DAILY_DIR, LOCAL_DAILY_DIR)
-    parse_export_pubmed(LOCAL_BASELINE_DIR, output_dir=OUTPUT_DIR)
+    parse_export_pubmed(LOCAL_BASELINE_DIR, output_dir=OUTPUT_DIR, workers=os.cpu_count())
     pass
\ No newline at end of file
@@ -1,54 +1,161 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 from lxml import etree
 import json
 
-from app.services.pubmed.dataset_pipeline.parser import parse_pubmed_article
-from app.services.pubmed.dataset_pipeline.streamer import stream_pubmed_gz
+from app.services.pubmed.dataset_pipeline.parser import ARTICLE_FIELDS
+from app.services.pubmed.dataset_pipeline.pmid_index import PmidIndex
+from app.services.pubmed.dataset_pipeline.streamer import stream_pubmed_articles
+from app.services.pubmed.dataset_pipeline.year_buffers import YearBuffers
+from app.utils.file_utils import COMPRESSION_SUFFIXES, PARQUET_BATCH_ROWS, iter_records, open_binary
 
-def parse_export_pubmed(input_dir, output_dir, sample_limit=None, starting_index=1):
+load_dotenv()
+# where YearBuffers spills runs past max_buffered_rows; unset uses the system temp dir
+PUBMED_SPILL_DIR = os.getenv("PUBMED_SPILL_DIR")
+OUTPUT_EXTENSIONS = {"jsonl": ".jsonl", "parquet": ".parquet"}
+
+def parse_export_pubmed(input_dir, output_dir, sample_limit=None, starting_index=1, workers=1, prefetch=False, fields=None, use_index=False, max_buffered_rows=None, output_format="jsonl", compression=None):
+    check_output_options(use_index, output_format, compression)
+    filenames = []
     for filename in sorted(os.listdir(input_dir)):
         if not filename.endswith(".gz"):
             continue
 
-        try:
-            idx = int(filename.replace("pubmed25n", "").replace(".xml.gz", ""))
-        except ValueError:
-            continue
-        if idx < starting_index:
+        idx = pubmed_file_index(filename)
+        if idx is None or idx < starting_index:
             continue
+        filenames.append(filename)
+
+    # With the PMID index, each shard only holds its own file's articles and the index tracks
+    # which shard has the current version, so existing shards are never reloaded.
+    options = dict(
+        sample_limit=sample_limit,
+        prefetch=prefetch,
+        fields=fields,
+        merge_existing=not use_index,
+        with_offsets=use_index,
+        max_buffered_rows=max_buffered_rows,
+        output_format=output_format,
+        compression=compression,
+    )
+    index = PmidIndex(output_dir) if use_index else None
+    try:
+        if workers <= 1:
+            for filename in filenames:
+                local_path = os.path.join(input_dir, filename)
+                commit_shards(export_pubmed_file(local_path, filename, output_dir, **options), index, pubmed_file_index(filename))
+            return
+
+        # Every source file owns its own (year, filename) shards, so workers never touch the
+        # same output path. Shards are staged as .part files and committed in sorted file order.
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(export_pubmed_file, os.path.join(input_dir, filename), filename, output_dir, **options)
+                for filename in filenames
+            ]
+            try:
+                for filename, future in zip(filenames, futures):
+                    commit_shards(future.result(), index, pubmed_file_index(filename))
+            except BaseException:
+                # A failed file stops the export: cancel what has not started and remove the
+                # .part files of workers that finished or were running, then re-raise
+                for future in futures:
+                    future.cancel()
+                for future in futures:
+                    if not future.cancelled() and future.exception() is None:
+                        discard_shards(future.result())
+                raise
+    finally:
+        if index is not None:
+            index.close()
+
+
+def parse_export_pubmed_single_file(local_path, filename, output_dir, prefetch=False, fields=None, use_index=False, max_buffered_rows=None, output_format="jsonl", compression=None):
+    check_output_options(use_index, output_format, compression)
+    shards = export_pubmed_file(
+        local_path, filename, output_dir,
+        prefetch=prefetch, fields=fields, merge_existing=not use_index, with_offsets=use_index, max_buffered_rows=max_buffered_rows,
+        output_format=output_format,
+        compression=compression,
+    )
+    if use_index:
+        with PmidIndex(output_dir) as index:
+            commit_shards(shards, index, pubmed_file_index(filename))
+    else:
+        commit_shards(shards)
+
+
+def check_output_options(use_index, output_format, compression=None):
+    if output_format not in OUTPUT_EXTENSIONS:
+        raise ValueError(f"Unknown output format {output_format!r}, expected one of {list(OUTPUT_EXTENSIONS)}")
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression {compression!r}, expected one of {list(COMPRESSION_SUFFIXES)}")
+    if compression and output_format != "jsonl":
+        raise ValueError("compression applies to jsonl output; parquet shards are compressed internally")
+    if use_index and (output_format != "jsonl" or compression):
+        raise ValueError("The PMID index stores byte offsets and needs uncompressed jsonl output")
+
+
+def pubmed_file_index(filename):
+    try:
+        return int(filename.replace("pubmed25n", "").replace(".xml.gz", ""))
+    except ValueError:
+        return None
+
+
+def export_pubmed_file(local_path, filename, output_dir, sample_limit=None, prefetch=False, fields=None, merge_existing=True, with_offsets=False, max_buffered_rows=None, deletions=None, output_format="jsonl", compression=None):
+    # fields limits what is parsed and written; date_published is always kept because it
+    # picks the year shard. Existing shards are merged by pmid, so merging into a shard
+    # written with other fields raises instead of replacing its rows: point projected
+    # exports at their own output_dir.
+    # max_buffered_rows caps the rows held in memory; past it year buffers spill to disk.
+    # with_offsets returns each shard's (pmid, offset) pairs for the PMID index, else None.
+    # compression ("gzip" or "zstd") writes <file>.jsonl.gz / .jsonl.zst shards.
+    if fields is not None:
+        fields = set(fields) | {"date_published"}
+    suffix = OUTPUT_EXTENSIONS[output_format] + COMPRESSION_SUFFIXES[compression]
+    written_fields = set(ARTICLE_FIELDS) if fields is None else fields | {"pmid"}
+
+    def check_fields(out_path, row):
+        if set(row) != written_fields:
+            raise ValueError(
+                f"{out_path} holds fields {sorted(row)}, not {sorted(written_fields)}; "
+                "export other fields to a separate output_dir"
+            )
+
+    def load_existing(out_path):
+        if os.path.exists(out_path) and output_format == "parquet":
+            for row in iter_records(out_path):
+                check_fields(out_path, row)
+                yield row["pmid"], row
+        elif os.path.exists(out_path):
+            with open_binary(out_path) as fr:
+                for line in fr:
+                    try:
+                        row = json.loads(line)
+                        pmid = row["pmid"]
+                    except (json.JSONDecodeError, KeyError):
+                        continue
+                    check_fields(out_path, row)
+                    yield pmid, row
 
-        local_path = os.path.join(input_dir, filename)
-        print(f"Processing {filename}...")
-
-        year_buffers = {}
-        def load_existing(year, out_path):
-            if os.path.exists(out_path):
-                existing = {}
-                with open(out_path, "r", encoding="utf-8") as fr:
-                    for line in fr:
-                        try:
-                            row = json.loads(line)
-                            existing[row["pmid"]] = row
-                        except:
-                            continue
-                return existing
-            return {}
-
-        count = 0
-        for elem in stream_pubmed_gz(local_path):
-            article = parse_pubmed_article(elem)
-            if article is None:
-                continue
+    print(f"Processing {filename}...")
+    count = 0
 
+    with YearBuffers(max_rows=max_buffered_rows, spill_dir=PUBMED_SPILL_DIR) as year_buffers:
+        for article in stream_pubmed_articles(local_path, fields=fields, prefetch=prefetch, deletions=deletions):
             year = article["date_published"][:4] if article["date_published"] else "UNKNOWN"
             year_dir = os.path.join(output_dir, year)
             os.makedirs(year_dir, exist_ok=True)
-            output_path = os.path.join(year_dir, filename.replace(".xml.gz", ".jsonl"))
+            output_path = os.path.join(year_dir, filename.replace(".xml.gz", suffix))
 
             if year not in year_buffers:
-                year_buffers[year] = load_existing(year, output_path)
-            year_buffers[year][article["pmid"]] = article
+                year_buffers.add_year(year)
+                if merge_existing:
+                    for pmid, row in load_existing(output_path):
+                        year_buffers.add(year, pmid, row)
+            year_buffers.add(year, article["pmid"], article)
             count += 1
 
             if sample_limit and count >= sample_limit:
@@ -56,61 +163,94 @@ def parse_export_pubmed(input_dir, output_dir, sample_limit=None, starting_index
             if count % 1000 == 0:
                 print(f"{count} articles processed in {filename}...")
 
-        for year, pmid_map in year_buffers.items():
-            year_dir = os.path.join(output_dir, year)
-            output_path = os.path.join(year_dir, filename.replace(".xml.gz", ".jsonl"))
-            with open(output_path, "w", encoding="utf-8") as fw:
-                for row in pmid_map.values():
-                    json.dump(row, fw, ensure_ascii=False)
-                    fw.write("\n")
+        shards = []
+        try:
+            for year in year_buffers.years():
+                year_dir = os.path.join(output_dir, year)
+                output_path = os.path.join(year_dir, filename.replace(".xml.gz", suffix))
+                part_path = output_path + ".part"
+                shards.append((part_path, output_path, None))
+                if output_format == "parquet":
+                    offsets = write_parquet_shard(part_path, year_buffers.rows(year, as_json=False), fields, with_offsets)
+                else:
+                    offsets = write_jsonl_shard(part_path, year_buffers.rows(year), compression, with_offsets)
+                shards[-1] = (part_path, output_path, offsets)
+        except BaseException:
+            discard_shards(shards)
+            raise
 
-        print(f"Finished {filename}, total articles processed: {count}")
+    print(f"Finished {filename}, total articles processed: {count}")
+    return shards
 
 
-def parse_export_pubmed_single_file(local_path, filename, output_dir):
-    year_buffers = {}
+def write_jsonl_shard(part_path, rows, compression=None, with_offsets=False):
+    # with_offsets: (pmid, byte offset) per line, for the PMID index; offsets are into the
+    # uncompressed stream
+    offsets = [] if with_offsets else None
+    offset = 0
+    with open_binary(part_path, "wb", compression) as fw:
+        for pmid, line in rows:
+            data = (line + "\n").encode("utf-8")
+            fw.write(data)
+            if with_offsets:
+                offsets.append((pmid, offset))
+                offset += len(data)
+    return offsets
 
-    def load_existing(year, out_path):
-        if os.path.exists(out_path):
-            existing = {}
-            with open(out_path, "r", encoding="utf-8") as fr:
-                for line in fr:
-                    try:
-                        row = json.loads(line)
-                        existing[row["pmid"]] = row
-                    except:
-                        continue
-            return existing
-        return {}
 
-    print(f"Processing {filename}...")
-    count = 0
+def write_parquet_shard(part_path, rows, fields=None, with_offsets=False):
+    # with_offsets: (pmid, row number) per row; authors stay a nested list<struct> column
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
-    for elem in stream_pubmed_gz(local_path):
-        article = parse_pubmed_article(elem)
-        if article is None:
-            continue
-        
-        year = article["date_published"][:4] if article["date_published"] else "UNKNOWN"
-        year_dir = os.path.join(output_dir, year)
-        os.makedirs(year_dir, exist_ok=True)
-        output_path = os.path.join(year_dir, filename.replace(".xml.gz", ".jsonl"))
+    schema = pubmed_arrow_schema(fields)
+    offsets = [] if with_offsets else None
+    batch = []
+    row_count = 0
+    with pq.ParquetWriter(part_path, schema, compression="zstd") as writer:
+        for pmid, row in rows:
+            if with_offsets:
+                offsets.append((pmid, row_count))
+            row_count += 1
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+        if batch or not row_count:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    return offsets
 
-        if year not in year_buffers:
-            year_buffers[year] = load_existing(year, output_path)
 
-        year_buffers[year][article["pmid"]] = article
-        count += 1
+def pubmed_arrow_schema(fields=None):
+    import pyarrow as pa
 
-        if count % 1000 == 0:
-            print(f"{count} articles processed...")
+    string_list = pa.list_(pa.string())
+    types = {
+        "pmid": pa.string(),
+        "publication_types": string_list,
+        "title": pa.string(),
+        "journal_title": pa.string(),
+        "authors": pa.list_(pa.struct([("full_name", pa.string()), ("affiliations", string_list)])),
+        "abstract": pa.string(),
+        "mesh_terms": string_list,
+        "date_published": pa.string(),
+        "language": pa.string(),
+    }
+    return pa.schema([
+        (field, types[field]) for field in ARTICLE_FIELDS
+        if fields is None or field in fields or field == "pmid"
+    ])
 
-    for year, pmid_map in year_buffers.items():
-        year_dir = os.path.join(output_dir, year)
-        output_path = os.path.join(year_dir, filename.replace(".xml.gz", ".jsonl"))
-        with open(output_path, "w", encoding="utf-8") as fw:
-            for row in pmid_map.values():
-                json.dump(row, fw, ensure_ascii=False)
-                fw.write("\n")
 
-    print(f"Finished {filename}, total articles processed: {count}")
+def commit_shards(shards, index=None, version=None):
+    for part_path, output_path, offsets in shards:
+        os.replace(part_path, output_path)
+        if index is not None:
+            index.upsert(version, output_path, offsets)
+
+
+def discard_shards(shards):
+    # removes staged .part files that were not committed
+    for part_path, output_path, offsets in shards:
+        if os.path.exists(part_path):
+            os.remove(part_path)
@@ -1,3 +1,25 @@
+ARTICLE_FIELDS = (
+    "pmid",
+    "publication_types",
+    "title",
+    "journal_title",
+    "authors",
+    "abstract",
+    "mesh_terms",
+    "date_published",
+    "language",
+)
+ALL_FIELDS = frozenset(ARTICLE_FIELDS)
+
+ARTICLE_TAG_FIELDS = {
+    "ArticleTitle": "title",
+    "Abstract": "abstract",
+    "AuthorList": "authors",
+    "Journal": "journal_title",
+    "Language": "language",
+    "PublicationTypeList": "publication_types",
+}
+
 def parse_pubmed_article(elem):   
     citation = elem.find("MedlineCitation")
     pubmed_data = elem.find("PubmedData")
@@ -96,3 +118,164 @@ def parse_pubmed_article(elem):
         "date_published": date_published,
         "language": language,
     }
+
+def text_of(elem):
+    text = elem.text
+    return text.strip() if text else None
+
+def extract_pubmed_article(elem, fields=None):
+    # Same output as parse_pubmed_article, but every container's children are visited once
+    # and dispatched on tag, instead of one find()/findall() walk per field.
+    # With fields set, only those keys (plus pmid) are built and returned.
+    if fields is None:
+        want = ALL_FIELDS
+    else:
+        want = set(fields) | {"pmid"}
+        if not want <= ALL_FIELDS:
+            raise ValueError(f"Unknown PubMed fields: {sorted(want - ALL_FIELDS)}")
+
+    citation = None
+    pubmed_data = None
+    for child in elem:
+        tag = child.tag
+        if tag == "MedlineCitation":
+            if citation is None:
+                citation = child
+        elif tag == "PubmedData":
+            if pubmed_data is None:
+                pubmed_data = child
+    if citation is None:
+        return None
+
+    pmid_elem = None
+    article_data = None
+    mesh_list = None
+    for child in citation:
+        tag = child.tag
+        if tag == "PMID":
+            if pmid_elem is None:
+                pmid_elem = child
+        elif tag == "Article":
+            if article_data is None:
+                article_data = child
+        elif tag == "MeshHeadingList":
+            if mesh_list is None and "mesh_terms" in want:
+                mesh_list = child
+
+    pmid = text_of(pmid_elem) if pmid_elem is not None else None
+    if not pmid:
+        return None
+
+    date_published = None
+    if pubmed_data is not None and "date_published" in want:
+        history = None
+        for child in pubmed_data:
+            if child.tag == "History":
+                history = child
+                break
+        if history is not None:
+            for pub_date in history:
+                if pub_date.tag != "PubMedPubDate" or pub_date.get("PubStatus") != "pubmed":
+                    continue
+                year = month = day = None
+                for part in pub_date:
+                    tag = part.tag
+                    if tag == "Year":
+                        if year is None:
+                            year = part
+                    elif tag == "Month":
+                        if month is None:
+                            month = part
+                    elif tag == "Day":
+                        if day is None:
+                            day = part
+                year = text_of(year) if year is not None else None
+                if year is not None:
+                    month = month.text.strip().zfill(2) if month is not None and month.text else "01"
+                    day = day.text.strip().zfill(2) if day is not None and day.text else "01"
+                    date_published = f"{year}-{month}-{day}"
+                break
+
+    title = None
+    abstract_text = None
+    authors = []
+    journal_title = None
+    language = None
+    pub_type = []
+    if article_data is not None:
+        seen = set()
+        for child in article_data:
+            tag = child.tag
+            if tag in seen or ARTICLE_TAG_FIELDS.get(tag) not in want:
+                continue
+            if tag == "ArticleTitle":
+                title = text_of(child)
+            elif tag == "Abstract":
+                parts = [a.text.strip() for a in child if a.tag == "AbstractText" and a.text]
+                abstract_text = " ".join(parts).strip() if parts else None
+            elif tag == "AuthorList":
+                authors = [extract_author(author) for author in child if author.tag == "Author"]
+            elif tag == "Journal":
+                for journal_child in child:
+                    if journal_child.tag == "Title":
+                        journal_title = text_of(journal_child)
+                        break
+            elif tag == "Language":
+                language = text_of(child)
+            elif tag == "PublicationTypeList":
+                pub_type = [p.text.strip() for p in child if p.tag == "PublicationType" and p.text and p.text.strip()]
+            seen.add(tag)
+
+    mesh_terms = []
+    if mesh_list is not None:
+        for mesh in mesh_list:
+            if mesh.tag != "MeshHeading":
+                continue
+            for descriptor_elem in mesh:
+                if descriptor_elem.tag == "DescriptorName":
+                    if descriptor_elem.text:
+                        mesh_terms.append(descriptor_elem.text.strip())
+                    break
+
+    article = {
+        "pmid": pmid,
+        "publication_types": pub_type,
+        "title": title,
+        "journal_title": journal_title,
+        "authors": authors,
+        "abstract": abstract_text,
+        "mesh_terms": mesh_terms,
+        "date_published": date_published,
+        "language": language,
+    }
+    if fields is None:
+        return article
+    return {field: value for field, value in article.items() if field in want}
+
+def extract_author(author):
+    last_name = ""
+    fore_name = ""
+    seen_last = seen_fore = False
+    affiliations = []
+    for child in author:
+        tag = child.tag
+        if tag == "LastName":
+            if not seen_last:
+                last_name = text_of(child) or ""
+                seen_last = True
+        elif tag == "ForeName":
+            if not seen_fore:
+                fore_name = text_of(child) or ""
+                seen_fore = True
+        elif tag == "AffiliationInfo":
+            for aff in child:
+                if aff.tag == "Affiliation":
+                    aff_text = text_of(aff)
+                    if aff_text and "contributed equally" not in aff_text.lower():
+                        affiliations.append(aff_text)
+                    break
+
+    return {
+        "full_name": f"{fore_name} {last_name}".strip() or None,
+        "affiliations": affiliations,
+    }
@@ -0,0 +1,108 @@
+import os
+import json
+import sqlite3
+
+INDEX_FILENAME = "pmid_index.sqlite"
+
+class PmidIndex:
+    # (PMID, version) -> (shard path, byte offset) for every exported copy of an article.
+    # version is the source file number (pubmed25nXXXX); the highest one is the current record.
+    # Paths are stored relative to output_dir so the export tree can be moved.
+    def __init__(self, output_dir, filename=INDEX_FILENAME):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, filename)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_table("pmid_index")
+        if self.primary_key() == ["pmid"]:
+            self.migrate_single_version()
+        self.conn.commit()
+
+    def create_table(self, name):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {name} (
+                pmid INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                PRIMARY KEY (pmid, version)
+            ) WITHOUT ROWID
+        """)
+
+    def primary_key(self):
+        columns = self.conn.execute("PRAGMA table_info(pmid_index)").fetchall()
+        return [name for _, name, _, _, _, pk in sorted(columns, key=lambda column: column[5]) if pk]
+
+    def migrate_single_version(self):
+        # Indexes written before every copy was tracked keyed on pmid alone and held only the
+        # newest copy; they carry over as is, so copies in older shards stay unindexed
+        with self.conn:
+            self.create_table("pmid_index_versions")
+            self.conn.execute(
+                "INSERT INTO pmid_index_versions (pmid, version, path, offset) "
+                "SELECT pmid, version, path, offset FROM pmid_index"
+            )
+            self.conn.execute("DROP TABLE pmid_index")
+            self.conn.execute("ALTER TABLE pmid_index_versions RENAME TO pmid_index")
+        print(f"Migrated {self.path} to one row per (pmid, version)")
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM pmid_index LIMIT 1").fetchone() is None
+
+    def upsert(self, version, output_path, offsets):
+        rel_path = os.path.relpath(output_path, self.output_dir)
+        self.conn.executemany(
+            """
+            INSERT INTO pmid_index (pmid, version, path, offset) VALUES (?, ?, ?, ?)
+            ON CONFLICT(pmid, version) DO UPDATE SET path = excluded.path, offset = excluded.offset
+            """,
+            ((int(pmid), version, rel_path, offset) for pmid, offset in offsets),
+        )
+        self.conn.commit()
+
+    def lookup(self, pmid):
+        row = self.conn.execute(
+            "SELECT version, path, offset FROM pmid_index WHERE pmid = ? ORDER BY version DESC LIMIT 1",
+            (int(pmid),),
+        ).fetchone()
+        if row is None:
+            return None
+        version, rel_path, offset = row
+        return version, os.path.join(self.output_dir, rel_path), offset
+
+    def locations(self, pmid):
+        rows = self.conn.execute(
+            "SELECT version, path, offset FROM pmid_index WHERE pmid = ? ORDER BY version", (int(pmid),)
+        ).fetchall()
+        return [(version, os.path.join(self.output_dir, rel_path), offset) for version, rel_path, offset in rows]
+
+    def set_offsets(self, version, offsets):
+        self.conn.executemany(
+            "UPDATE pmid_index SET offset = ? WHERE pmid = ? AND version = ?",
+            ((offset, int(pmid), version) for pmid, offset in offsets),
+        )
+        self.conn.commit()
+
+    def delete(self, pmids):
+        self.conn.executemany("DELETE FROM pmid_index WHERE pmid = ?", ((int(pmid),) for pmid in pmids))
+        self.conn.commit()
+
+    def read_record(self, pmid):
+        location = self.lookup(pmid)
+        if location is None:
+            return None
+        _, path, offset = location
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
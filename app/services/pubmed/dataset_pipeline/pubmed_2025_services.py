@@ -1,54 +1,34 @@
-from time import sleep
 import os
 import json
-import requests
-import xmltodict
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from app.services.pubmed.api_pipeline.eutils_client import get_sync_client
 
-PUBMED_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-ESEARCH_ENDPOINT = PUBMED_BASE_URL + "esearch.fcgi"
-EFETCH_ENDPOINT = PUBMED_BASE_URL + "efetch.fcgi"
 BATCH_SIZE = 1000
 MAX_ARTICLES = 0
+# a history query can only be paged through its first 9,999 records
+MAX_WINDOW_RECORDS = 9999
+WINDOW_WORKERS = 3
+# Entrez date span bisected to split a query past that limit; PubMed's oldest records are
+# from the 1780s and "3000" is its usual open upper bound
+ENTREZ_DATE_MIN = date(1700, 1, 1)
+ENTREZ_DATE_MAX = date(3000, 12, 31)
 
 def pubmed_search_year(year: int):
-    params = {
-        "db": "pubmed",
-        "term": f"{year}[DP]",
-        "usehistory": "y",
-        "retmax": 0,
-    }
-
-    r = requests.get(ESEARCH_ENDPOINT, params=params)
-    r.raise_for_status()
-
-    data = xmltodict.parse(r.text)["eSearchResult"]
+    data = get_sync_client().esearch(f"{year}[DP]")
     return {
-        "webenv": data["WebEnv"],
-        "query_key": data["QueryKey"],
-        "count": data["Count"]
+        "webenv": data["webenv"],
+        "query_key": data["query_key"],
+        "count": data["count"]
     }
 
-def pubmed_fetch_batches(webenv: str, query_key: str, count: int):
-    retstart = 0
-
-    while retstart < count:
-        batch_size = min(BATCH_SIZE, count - retstart)
-        params = {
-            "db": "pubmed",
-            "query_key": query_key,
-            "WebEnv": webenv,
-            "retstart": retstart,
-            "retmax": batch_size,
-            "rettype": "xml",
-            "retmode": "xml",
-        }
-
-        r = requests.get(EFETCH_ENDPOINT, params=params)
-        r.raise_for_status()
-
-        yield xmltodict.parse(r.text)
-        retstart += BATCH_SIZE
-        sleep(0.34)
+def pubmed_fetch_batches(webenv: str, query_key: str, count: int, fields=None):
+    # Lists of article dicts, one per efetch window. Windows are fetched concurrently under the
+    # client's rate limit and each response is stream-parsed with the baseline extractor.
+    for _, articles in get_sync_client().efetch_history(webenv, query_key, count, batch_size=BATCH_SIZE, parse=True, fields=fields):
+        yield articles
 
 def get_pubmed_year(year: int = 2025):
     search = pubmed_search_year(year)
@@ -57,140 +37,155 @@ def get_pubmed_year(year: int = 2025):
     for batch in pubmed_fetch_batches(search["webenv"], search["query_key"], count=count):
         yield batch
 
-def parse_pubmed_article(elem):   
-    citation = elem.find("MedlineCitation")
-    pubmed_data = elem.find("PubmedData")
-    article_data = citation.find("Article") if citation is not None else None
-
-    pmid_elem = citation.find("PMID") if citation is not None else None
-    pmid = pmid_elem.text.strip() if (pmid_elem is not None and pmid_elem.text) else None
-    if not pmid:
-        return None
-    
-    date_published = None
-    history = pubmed_data.find("History") if pubmed_data is not None else None
-    if history is not None:
-        for pub_date in history.findall("PubMedPubDate"):
-            if pub_date.get("PubStatus") == "pubmed":
-                year = pub_date.find("Year").text.strip() if pub_date.find("Year") is not None and pub_date.find("Year").text else None
-                month = pub_date.find("Month").text.strip().zfill(2) if pub_date.find("Month") is not None and pub_date.find("Month").text else "01"
-                day = pub_date.find("Day").text.strip().zfill(2) if pub_date.find("Day") is not None and pub_date.find("Day").text else "01"
-                if year is not None:
-                    date_published = f"{year}-{month}-{day}"
-                else: date_published = None
-                break
-
-    title_elem = article_data.find("ArticleTitle") if article_data is not None else None
-    title = title_elem.text.strip() if (title_elem is not None and title_elem.text) else None
-
-    abstract_text = None
-    abstract_sect = article_data.find("Abstract") if article_data is not None else None
-    if abstract_sect is not None:
-        abstract_raw = abstract_sect.findall("AbstractText")
-        if abstract_raw:
-            parts = []
-            for a in abstract_raw:
-                if a.text:
-                    parts.append(a.text.strip())
-            abstract_text = " ".join(parts).strip() if parts else None
-
-    authors = []
-    author_list = article_data.find("AuthorList") if article_data is not None else None
-    if author_list is not None:
-        for author in author_list.findall("Author"):
-            last_name_elem = author.find("LastName")
-            fore_name_elem = author.find("ForeName")
-            last_name = last_name_elem.text.strip() if (last_name_elem is not None and last_name_elem.text) else ""
-            fore_name = fore_name_elem.text.strip() if (fore_name_elem is not None and fore_name_elem.text) else ""
-            full_name = f"{fore_name} {last_name}".strip() or None
-
-            aff_info = author.findall("AffiliationInfo")
-            author_affiliations = []
-            for aff in aff_info:
-                aff_text_elem = aff.find("Affiliation")
-                aff_text = aff_text_elem.text.strip() if (aff_text_elem is not None and aff_text_elem.text) else ""
-                if aff_text and "contributed equally" not in aff_text.lower():
-                    author_affiliations.append(aff_text)
-
-            authors.append({
-                "full_name": full_name,
-                "affiliations": author_affiliations
-            })
-
-    journal_title = None
-    language = None
-    if article_data is not None:
-        journal_elem = article_data.find("Journal")
-        if journal_elem is not None:
-            journal_title_elem = journal_elem.find("Title")
-            journal_title = journal_title_elem.text.strip() if (journal_title_elem is not None and journal_title_elem.text) else None
-        language_elem = article_data.find("Language")
-        language = language_elem.text.strip() if (language_elem is not None and language_elem.text) else None
-
-    pub_type = []
-    if article_data is not None:
-        pub_type_list = article_data.find("PublicationTypeList")
-        if pub_type_list is not None:
-            for p in pub_type_list.findall("PublicationType"):
-                type_text = p.text.strip() if (p is not None and p.text) else None
-                if type_text:
-                    pub_type.append(type_text)
-
-    mesh_terms = []
-    mesh_list = citation.find("MeshHeadingList") if citation is not None else None
-    if mesh_list is not None:
-        for mesh in mesh_list.findall("MeshHeading"):
-            descriptor_elem = mesh.find("DescriptorName")
-            if descriptor_elem is not None and descriptor_elem.text:
-                mesh_terms.append(descriptor_elem.text.strip())
-
-    return {
-        "pmid": pmid,
-        "publication_types": pub_type,
-        "title": title,
-        "journal_title": journal_title,
-        "authors": authors,
-        "abstract": abstract_text,
-        "mesh_terms": mesh_terms,
-        "date_published": date_published,
-        "language": language,
-    }
-
-def parse_date(date_dict: dict):
-    if not date_dict: return None
-    year = date_dict.get("Year")
-    if not year: return None
-    
-    month = date_dict.get("Month", "01").zfill(2)
-    day = date_dict.get("Day", "01").zfill(2)
-    return f"{year}-{month}-{day}"
-
-def export_pubmed_year(year: int):
+def pubmed_date_windows(year: int):
+    # (start, end, entrez, count) windows covering the year: months, split into weeks and
+    # then days where a window holds more records than one history query can page through.
+    # A day still over the limit is split into Entrez date ranges, entrez=(start, end);
+    # other windows have entrez=None.
+    windows = []
+    for month in range(1, 13):
+        start = date(year, month, 1)
+        end = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+        windows.extend(split_date_window(start, end))
+    return windows
+
+def split_date_window(start: date, end: date):
+    count = get_sync_client().esearch(date_window_term(start, end), usehistory=False)["count"]
+    if count <= MAX_WINDOW_RECORDS:
+        return [(start, end, None, count)] if count else []
+    if start == end:
+        return [(start, end, entrez, c) for *entrez, c in split_entrez_dates(date_window_term(start, end), count)]
+    step = timedelta(days=7) if (end - start).days > 7 else timedelta(days=1)
+    windows = []
+    while start <= end:
+        windows.extend(split_date_window(start, min(end, start + step - timedelta(days=1))))
+        start += step
+    return windows
+
+def split_entrez_dates(term: str, count: int, start: date = ENTREZ_DATE_MIN, end: date = ENTREZ_DATE_MAX):
+    # (start, end, count) Entrez date ranges that split the `count` records of `term` into
+    # pieces one history query can page through, by bisecting [start, end]. The ranges are
+    # disjoint, so no record is fetched twice. A single Entrez day still over the limit is
+    # returned as is and fails when harvested.
+    if count <= MAX_WINDOW_RECORDS or start == end:
+        if count > MAX_WINDOW_RECORDS:
+            print(f"Warning: {term} has {count} records entered on {start}, more than one history query can page through")
+        return [(start, end, count)] if count else []
+    middle = start + (end - start) // 2
+    ranges = []
+    for lo, hi in ((start, middle), (middle + timedelta(days=1), end)):
+        sub_count = get_sync_client().esearch(entrez_date_term(term, lo, hi), usehistory=False)["count"]
+        ranges.extend(split_entrez_dates(term, sub_count, lo, hi))
+    return ranges
+
+def date_window_term(start: date, end: date, entrez=None):
+    term = f'"{start:%Y/%m/%d}"[DP] : "{end:%Y/%m/%d}"[DP]'
+    return entrez_date_term(term, *entrez) if entrez else term
+
+def entrez_date_term(term: str, start: date, end: date):
+    return f'({term}) AND "{start:%Y/%m/%d}"[EDAT] : "{end:%Y/%m/%d}"[EDAT]'
+
+def pubmed_query_batches(term: str, fields=None):
+    # Article lists for every record of a query small enough for one history search
+    search = get_sync_client().esearch(term)
+    if search["count"] > MAX_WINDOW_RECORDS:
+        raise ValueError(f"{term} matches {search['count']} records, a history query can only page through {MAX_WINDOW_RECORDS}")
+    yield from pubmed_fetch_batches(search["webenv"], search["query_key"], count=search["count"], fields=fields)
+
+def harvest_date_window(start: date, end: date, path: str, entrez=None):
+    # One window to its own file; the rename marks it done for resumed runs. A window over
+    # the history limit raises rather than being cut short.
+    written = 0
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        for articles in pubmed_query_batches(date_window_term(start, end, entrez)):
+            for article in articles:
+                f.write(json.dumps(article, ensure_ascii=False) + "\n")
+            written += len(articles)
+    os.replace(path + ".part", path)
+    return written
+
+def export_pubmed_year(year: int, workers: int = WINDOW_WORKERS):
+    # The year is harvested as adaptive date windows, `workers` at a time, all sharing the
+    # E-utilities client's rate limit. Each finished window is kept under
+    # pubmed_<year>_windows/, so a rerun after a failure only fetches the missing windows;
+    # the windows are stitched into pubmed_<year>.jsonl once all of them are done.
     script_dir = os.path.dirname(os.path.abspath(__file__))
     OUTPUT_FOLDER = os.path.join(script_dir, "..", "exports")
     os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
     OUTPUT_FILE = f"pubmed_{year}.jsonl"
     full_path = os.path.join(OUTPUT_FOLDER, OUTPUT_FILE)
+    window_dir = os.path.join(OUTPUT_FOLDER, f"pubmed_{year}_windows")
+    os.makedirs(window_dir, exist_ok=True)
+
+    # the window plan is saved so a resumed run writes to the same window files
+    plan_path = os.path.join(window_dir, "plan.json")
+    if os.path.exists(plan_path):
+        with open(plan_path, "r", encoding="utf-8") as f:
+            windows = [window_from_json(item) for item in json.load(f)]
+    else:
+        count = int(pubmed_search_year(year)["count"])
+        print(f"Total articles for {year}: {count}")
+        windows = pubmed_date_windows(year)
+        planned = sum(c for *_, c in windows)
+        if planned != count:
+            print(f"Warning: date windows cover {planned} of {count} records for {year}")
+        with open(plan_path + ".part", "w", encoding="utf-8") as f:
+            json.dump([window_to_json(window) for window in windows], f)
+        os.replace(plan_path + ".part", plan_path)
+
+    paths = [os.path.join(window_dir, window_name(window) + ".jsonl") for window in windows]
+    todo = [(window, path) for window, path in zip(windows, paths) if not os.path.exists(path)]
+    print(f"{len(windows)} date windows for {year}, {len(todo)} left to harvest")
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {}
+        for window, path in todo:
+            start, end, entrez, _ = window
+            futures[executor.submit(harvest_date_window, start, end, path, entrez)] = window_name(window)
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                print(f"Harvested window {name}: {future.result()} articles")
+            except Exception as ex:
+                print(f"Failed window {name}: {ex!r}")
+                failed.append(name)
+
+    if failed:
+        print(f"{len(failed)} windows failed, rerun to resume: {sorted(failed)}")
+        return sorted(failed)
 
-    count = int(pubmed_search_year(year)["count"])
-    print(f"Total articles for {year}: {count}")
-
-    batch_num = 1
     total_written = 0
-
-    with open(full_path, "w", encoding="utf-8") as f:
-        for batch in get_pubmed_year(year):
-            parsed_articles = parse_pubmed_article(batch)
-
-            for article in parsed_articles:
-                f.write(json.dumps(article) + "\n")
-
-            total_written += len(parsed_articles)
-            print(f"Wrote batch {batch_num}, {len(parsed_articles)} articles (total {total_written})")
-            batch_num += 1
-
-    print(f"Finished exporting PubMed articles for {year} to {OUTPUT_FILE}")
+    with open(full_path + ".part", "w", encoding="utf-8") as f:
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as fr:
+                for line in fr:
+                    f.write(line)
+                    total_written += 1
+    os.replace(full_path + ".part", full_path)
+    shutil.rmtree(window_dir)
+
+    print(f"Finished exporting {total_written} PubMed articles for {year} to {OUTPUT_FILE}")
+    return []
+
+def window_name(window):
+    # 20250101_20250131, or 20250101_20250101_edat20240101_20240630 for an Entrez date range
+    start, end, entrez, _ = window
+    name = f"{start:%Y%m%d}_{end:%Y%m%d}"
+    return name + f"_edat{entrez[0]:%Y%m%d}_{entrez[1]:%Y%m%d}" if entrez else name
+
+def window_to_json(window):
+    start, end, entrez, count = window
+    return [start.isoformat(), end.isoformat(), [d.isoformat() for d in entrez] if entrez else None, count]
+
+def window_from_json(item):
+    # plans saved before Entrez date splitting hold [start, end, count]
+    if len(item) == 3:
+        item = [item[0], item[1], None, item[2]]
+    start, end, entrez, count = item
+    entrez = tuple(date.fromisoformat(d) for d in entrez) if entrez else None
+    return date.fromisoformat(start), date.fromisoformat(end), entrez, count
 
 if __name__ == "__main__":
     export_pubmed_year(2025)
@@ -1,15 +1,142 @@
 import gzip
+import queue
+import threading
 from lxml import etree
 import zlib
 
-def stream_pubmed_gz(path):
+from app.services.pubmed.dataset_pipeline.parser import extract_pubmed_article
+
+# python-isal inflates gzip several times faster than zlib; fall back to the stdlib if missing
+try:
+    from isal import igzip as gzip_backend
+    from isal.isal_zlib import error as isal_error
+    GZIP_ERRORS = (OSError, gzip.BadGzipFile, zlib.error, EOFError, isal_error)
+except ImportError:
+    gzip_backend = gzip
+    GZIP_ERRORS = (OSError, gzip.BadGzipFile, zlib.error, EOFError)
+
+PREFETCH_CHUNK_SIZE = 1 << 20
+PREFETCH_MAX_CHUNKS = 16
+# inflate step; a truncated file loses at most this much, the same as lxml reading it directly
+PREFETCH_READ_SIZE = 1 << 15
+
+def stream_pubmed_gz(path, prefetch=False, deletions=None):
+    # Update files end with <DeleteCitation> blocks; pass a list to collect their PMIDs
+    tags = ("PubmedArticle", "DeleteCitation") if deletions is not None else "PubmedArticle"
     try:
-        with gzip.open(path, "rb") as f:
-            context = etree.iterparse(f, events=("end",), tag="PubmedArticle", recover=True)
+        source = PrefetchReader(path) if prefetch else gzip_backend.open(path, "rb")
+        with source as f:
+            context = etree.iterparse(f, events=("end",), tag=tags, recover=True)
             for event, elem in context:
+                if elem.tag == "DeleteCitation":
+                    deletions.extend(pmid.text.strip() for pmid in elem.iter("PMID") if pmid.text and pmid.text.strip())
+                    elem.clear()
+                    continue
                 yield elem
                 elem.clear()
                 while elem.getprevious() is not None:
                     del elem.getparent()[0]
-    except (OSError, gzip.BadGzipFile, zlib.error) as e:
-        print(f"Skipping corrupted file {path}: {e}")
\ No newline at end of file
+    except GZIP_ERRORS as e:
+        print(f"Skipping corrupted file {path}: {e}")
+
+def stream_pubmed_articles(path, fields=None, prefetch=False, deletions=None):
+    # Parsed article dicts, limited to `fields` (pmid is always included)
+    for elem in stream_pubmed_gz(path, prefetch=prefetch, deletions=deletions):
+        article = extract_pubmed_article(elem, fields)
+        if article is not None:
+            yield article
+
+
+def pubmed_pull_parser():
+    # Incremental parser for XML that arrives in chunks, e.g. an efetch response body
+    return etree.XMLPullParser(events=("end",), tag="PubmedArticle", recover=True)
+
+def read_pubmed_articles(parser, fields=None):
+    # Articles completed by the bytes fed to `parser` so far, with their elements freed
+    for event, elem in parser.read_events():
+        article = extract_pubmed_article(elem, fields)
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+        if article is not None:
+            yield article
+
+
+class PrefetchReader:
+    # Decompresses on a background thread (inflate releases the GIL) and hands bounded
+    # chunks to the parser through a queue, so zlib runs alongside parsing and JSON encoding.
+    def __init__(self, path, chunk_size=PREFETCH_CHUNK_SIZE, max_chunks=PREFETCH_MAX_CHUNKS):
+        self._chunks = queue.Queue(maxsize=max_chunks)
+        self._stop = threading.Event()
+        self._chunk = b""
+        self._pos = 0
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, args=(path, chunk_size), daemon=True)
+        self._thread.start()
+
+    def _fill(self, path, chunk_size):
+        # Chunks are built from small reads so that on a truncated file the bytes inflated
+        # before the error still reach the parser, as they do when streaming serially
+        chunk = bytearray()
+        try:
+            with gzip_backend.open(path, "rb") as f:
+                while not self._stop.is_set():
+                    data = f.read1(min(PREFETCH_READ_SIZE, chunk_size - len(chunk)))
+                    if not data:
+                        break
+                    chunk += data
+                    if len(chunk) >= chunk_size:
+                        self._put(bytes(chunk))
+                        chunk.clear()
+            if chunk:
+                self._put(bytes(chunk))
+            self._put(None)
+        except Exception as e:
+            if chunk:
+                self._put(bytes(chunk))
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            parts = [self._chunk[self._pos:]]
+            while self._next_chunk():
+                parts.append(self._chunk)
+            self._chunk, self._pos = b"", 0
+            return b"".join(parts)
+
+        if self._pos >= len(self._chunk) and not self._next_chunk():
+            return b""
+        data = self._chunk[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
+
+    def _next_chunk(self):
+        if self._eof:
+            return False
+        item = self._chunks.get()
+        if item is None:
+            self._eof = True
+            return False
+        if isinstance(item, Exception):
+            self._eof = True
+            raise item
+        self._chunk, self._pos = item, 0
+        return True
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
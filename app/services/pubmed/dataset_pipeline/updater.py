@@ -0,0 +1,115 @@
+import os
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+from app.services.pubmed.dataset_pipeline.downloader_baseline import file_md5
+from app.services.pubmed.dataset_pipeline.exporter import commit_shards, export_pubmed_file, pubmed_file_index
+from app.services.pubmed.dataset_pipeline.pmid_index import INDEX_FILENAME, PmidIndex
+from app.utils.file_utils import load_json_state, save_json_state
+
+load_dotenv()
+LOCAL_DAILY_DIR = os.getenv("LOCAL_DAILY_DIR")
+OUTPUT_DIR = os.getenv("OUTPUT_DIR")
+MANIFEST_FILENAME = "update_manifest.json"
+
+def apply_pubmed_updates(input_dir, output_dir, manifest_path=None, prefetch=False):
+    # Applies every update file not yet in the manifest, in file order: articles are written
+    # as that file's shards and indexed as the newest version, then <DeleteCitation> PMIDs are
+    # removed from every shard that holds a copy. Relies on the PMID index, so the baseline
+    # has to be exported with parse_export_pubmed(..., use_index=True).
+    manifest_path = manifest_path or os.path.join(output_dir, MANIFEST_FILENAME)
+    manifest = load_manifest(manifest_path)
+    applied = 0
+
+    # without the index DeleteCitation PMIDs could not be found in the baseline shards
+    if not os.path.exists(os.path.join(output_dir, INDEX_FILENAME)):
+        raise ValueError(f"No PMID index in {output_dir}; export the baseline with use_index=True first")
+    with PmidIndex(output_dir) as index:
+        if index.is_empty():
+            raise ValueError(f"The PMID index in {output_dir} is empty; export the baseline with use_index=True first")
+        for filename in sorted(os.listdir(input_dir)):
+            version = pubmed_file_index(filename) if filename.endswith(".xml.gz") else None
+            if version is None:
+                continue
+
+            local_path = os.path.join(input_dir, filename)
+            stat = os.stat(local_path)
+            entry = manifest["files"].get(filename)
+            if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+            checksum = file_md5(local_path)
+            if entry and entry["md5"] == checksum:
+                entry["mtime"] = stat.st_mtime
+                save_manifest(manifest_path, manifest)
+                continue
+
+            deletions = []
+            shards = export_pubmed_file(
+                local_path, filename, output_dir,
+                prefetch=prefetch, merge_existing=False, with_offsets=True, deletions=deletions,
+            )
+            commit_shards(shards, index, version)
+            deleted = delete_pmids(index, deletions)
+            print(f"Applied {filename}: {sum(len(offsets) for _, _, offsets in shards)} upserts, {deleted} deletions")
+
+            manifest["files"][filename] = {
+                "md5": checksum,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "articles": sum(len(offsets) for _, _, offsets in shards),
+                "deleted": len(deletions),
+                "applied_at": datetime.now(timezone.utc).isoformat(),
+            }
+            save_manifest(manifest_path, manifest)
+            applied += 1
+
+    print(f"Applied {applied} new update files")
+    return applied
+
+
+def delete_pmids(index, pmids):
+    # Drop every exported copy of the given PMIDs, rewriting each affected shard once
+    by_shard = defaultdict(set)
+    for pmid in set(pmids):
+        for version, path, offset in index.locations(pmid):
+            by_shard[(version, path)].add(offset)
+
+    removed = 0
+    for (version, path), drop_offsets in by_shard.items():
+        if not os.path.exists(path):
+            continue
+        part_path = path + ".part"
+        moved = []
+        old_offset = new_offset = 0
+        with open(path, "rb") as fr, open(part_path, "wb") as fw:
+            for line in fr:
+                if old_offset in drop_offsets:
+                    removed += 1
+                else:
+                    fw.write(line)
+                    # rows after a removed line shift up; re-point their index entries
+                    if new_offset != old_offset:
+                        moved.append((json.loads(line)["pmid"], new_offset))
+                    new_offset += len(line)
+                old_offset += len(line)
+        os.replace(part_path, path)
+        index.set_offsets(version, moved)
+
+    index.delete(pmids)
+    return removed
+
+
+def load_manifest(path):
+    return load_json_state(path, {"files": {}})
+
+
+def save_manifest(path, manifest):
+    save_json_state(path, manifest)
+
+
+if __name__ == "__main__":
+    # Nightly sync after downloading new update files
+    # python -m app.services.pubmed.dataset_pipeline.updater
+    apply_pubmed_updates(LOCAL_DAILY_DIR, OUTPUT_DIR)
@@ -0,0 +1,102 @@
+import os
+import json
+import heapq
+import shutil
+import tempfile
+
+def pmid_sort_key(pmid):
+    # numeric order for digit strings without int() failing on anything odd
+    return (len(pmid), pmid)
+
+class YearBuffers:
+    # year -> {pmid: row}, last write wins, like the exporter's old year_buffers dict.
+    # With max_rows set, once more than max_rows rows are held every year is written out
+    # as a PMID-sorted run file and rows() k-way merges the runs, so memory stays bounded.
+    # Years that never spilled keep insertion order; spilled years come out in PMID order.
+    # Run files go to a temporary directory under spill_dir (the system temp dir if None).
+    def __init__(self, max_rows=None, spill_dir=None):
+        self.max_rows = max_rows
+        self.spill_dir = spill_dir
+        self.buffers = {}
+        self.runs = {}
+        self.size = 0
+        self.tmp_dir = None
+
+    def __contains__(self, year):
+        return year in self.buffers
+
+    def years(self):
+        return list(self.buffers)
+
+    def add_year(self, year):
+        self.buffers.setdefault(year, {})
+
+    def add(self, year, pmid, row):
+        buffer = self.buffers.setdefault(year, {})
+        if pmid not in buffer:
+            self.size += 1
+        buffer[pmid] = row
+        if self.max_rows and self.size > self.max_rows:
+            self.spill()
+
+    def spill(self):
+        if self.tmp_dir is None:
+            self.tmp_dir = tempfile.mkdtemp(prefix="pubmed_spill_", dir=self.spill_dir)
+        for year, buffer in self.buffers.items():
+            if not buffer:
+                continue
+            runs = self.runs.setdefault(year, [])
+            path = os.path.join(self.tmp_dir, f"{year}_{len(runs)}.tsv")
+            with open(path, "w", encoding="utf-8") as f:
+                for pmid in sorted(buffer, key=pmid_sort_key):
+                    f.write(f"{pmid}\t{json.dumps(buffer[pmid], ensure_ascii=False)}\n")
+            runs.append(path)
+            self.buffers[year] = {}
+        self.size = 0
+
+    def rows(self, year, as_json=True):
+        # (pmid, json line) pairs for one year, or (pmid, dict) with as_json=False
+        buffer = self.buffers.get(year, {})
+        runs = self.runs.get(year)
+        if not runs:
+            for pmid, row in buffer.items():
+                yield pmid, json.dumps(row, ensure_ascii=False) if as_json else row
+            return
+
+        files = [open(path, "r", encoding="utf-8") for path in runs]
+        try:
+            sources = [read_run(f, run_no) for run_no, f in enumerate(files)]
+            in_memory = (
+                (pmid_sort_key(pmid), len(files), pmid, json.dumps(buffer[pmid], ensure_ascii=False))
+                for pmid in sorted(buffer, key=pmid_sort_key)
+            )
+            sources.append(in_memory)
+
+            # equal PMIDs arrive ordered by run number, so the last one is the newest
+            pending = None
+            for key, _, pmid, line in heapq.merge(*sources):
+                if pending is not None and pending[0] != pmid:
+                    yield pending if as_json else (pending[0], json.loads(pending[1]))
+                pending = (pmid, line)
+            if pending is not None:
+                yield pending if as_json else (pending[0], json.loads(pending[1]))
+        finally:
+            for f in files:
+                f.close()
+
+    def close(self):
+        if self.tmp_dir is not None:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            self.tmp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_run(f, run_no):
+    for line in f:
+        pmid, _, row = line.rstrip("\n").partition("\t")
+        yield pmid_sort_key(pmid), run_no, pmid, row
@@ -1,40 +1,101 @@
-import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from dotenv import load_dotenv
 from app.db.models import PubMed
-from app.db.session import SessionLocal
+from app.db.bulk import COPY_CHUNK_ROWS, copy_upsert, create_staging, drop_staging, merge_staging, stage_rows, worker_engine
 from app.utils.date_utils import str_to_date
+from app.utils.file_utils import is_record_file, iter_records
 
 load_dotenv()
 FOLDER_PATH = os.getenv("OUTPUT_DIR")
 
-def load_pubmed_jsonl(file_path: str):
-    with SessionLocal() as db:
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                record = json.loads(line)
-
-                pmid = record.get("pmid")
-                title = record.get("title")
-                if not pmid or not title: # primary key check
-                    continue
-
-                pubmed_entry = PubMed(
-                    pmid = int(pmid),
-                    publication_types = record.get("publication_types"),
-                    title = record.get("title"),
-                    journal_title = record.get("journal_title"),
-                    authors = record.get("authors"),
-                    abstract = record.get("abstract"),
-                    mesh_terms = record.get("mesh_terms"),
-                    date_published = str_to_date(record.get("date_published")),
-                    language = record.get("language")
-                )
-                db.merge(pubmed_entry)  # Merge equivalent to insert/update
-        db.commit()
-    
+def load_pubmed_jsonl(file_path: str, chunk_size: int = COPY_CHUNK_ROWS):
+    # Also reads the exporter's .parquet shards; COPY + upsert, committed every chunk_size rows
+    return copy_upsert(PubMed.__table__, pubmed_rows(file_path), chunk_size)
+
+def pubmed_rows(file_path: str):
+    for record in iter_records(file_path):
+        row = pubmed_row(record)
+        if row is not None:
+            yield row
+
+def pubmed_row(record: dict):
+    # exported (or freshly parsed) article -> pubmed table row, None without a primary key
+    pmid = record.get("pmid")
+    title = record.get("title")
+    if not pmid or not title: # primary key check
+        return None
+
+    return {
+        "pmid": int(pmid),
+        "publication_types": record.get("publication_types"),
+        "title": record.get("title"),
+        "journal_title": record.get("journal_title"),
+        "authors": record.get("authors"),
+        "abstract": record.get("abstract"),
+        "mesh_terms": record.get("mesh_terms"),
+        "date_published": str_to_date(record.get("date_published")),
+        "language": record.get("language"),
+    }
+
+def load_pubmed_dir(root_dir: str = FOLDER_PATH, years: tuple[int, int] | None = None, workers: int | None = None, chunk_size: int = COPY_CHUNK_ROWS):
+    # Loads every export under root_dir (or only the <year>/ folders within the inclusive
+    # years range) with `workers` processes, each on its own connection: files are COPYed
+    # into an unlogged staging table, then pmid % workers partitions are merged into
+    # pubmed in parallel. Files are ranked by name (pubmed25n0001 < ... < the daily
+    # updates), so a pmid in several files keeps its row from the latest one.
+    workers = workers or os.cpu_count()
+    files = pubmed_export_files(root_dir, years)
+    print(f"Loading {len(files)} files from {root_dir} with {workers} workers")
+
+    staging = create_staging(PubMed.__table__)
+    try:
+        start = time.time()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            staged = 0
+            for path, count in zip(files, executor.map(stage_pubmed_file, files, range(len(files)), repeat(staging), repeat(chunk_size))):
+                staged += count
+                print(f"Staged {count} rows from {os.path.basename(path)}")
+            stage_seconds = time.time() - start
+            print(f"Staged {staged} rows in {stage_seconds:.1f}s ({staged / max(stage_seconds, 1e-9):.0f} rows/s)")
+
+            merged = sum(executor.map(merge_pubmed_partition, repeat(staging), range(workers), repeat(workers)))
+    finally:
+        drop_staging(staging)
+
+    seconds = time.time() - start
+    print(f"Wrote {merged} new or changed pmids in {seconds - stage_seconds:.1f}s; {staged} rows in {seconds:.1f}s total ({staged / max(seconds, 1e-9):.0f} rows/s)")
+    return merged
+
+def pubmed_export_files(root_dir, years=None):
+    # export files under root_dir/<year>/, ordered by file name
+    files = []
+    for year in sorted(os.listdir(root_dir)):
+        year_dir = os.path.join(root_dir, year)
+        if not os.path.isdir(year_dir):
+            continue
+        if years and not (year.isdigit() and years[0] <= int(year) <= years[1]):
+            continue
+        files.extend(os.path.join(year_dir, name) for name in os.listdir(year_dir) if is_record_file(name))
+    return sorted(files, key=lambda path: (os.path.basename(path), path))
+
+def stage_pubmed_file(path, file_rank, staging, chunk_size):
+    return stage_rows(PubMed.__table__, staging, pubmed_rows(path), file_rank, chunk_size, bind=worker_engine())
+
+def merge_pubmed_partition(staging, part, parts):
+    return merge_staging(PubMed.__table__, staging, part, parts, bind=worker_engine())
+
 
 if __name__ == "__main__":
     #python -m app.services.pubmed.pubmed_loader
-    file_path = os.path.join(FOLDER_PATH, "2025", "pubmed25n1637.jsonl")
-    load_pubmed_jsonl(file_path)
\ No newline at end of file
+    #python -m app.services.pubmed.pubmed_loader --years 2020 2025 --workers 8
+    import argparse
+    parser = argparse.ArgumentParser(description="Load PubMed exports into Postgres")
+    parser.add_argument("root_dir", nargs="?", default=FOLDER_PATH)
+    parser.add_argument("--years", type=int, nargs=2, metavar=("FIRST", "LAST"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=COPY_CHUNK_ROWS)
+    args = parser.parse_args()
+    load_pubmed_dir(args.root_dir, tuple(args.years) if args.years else None, args.workers, args.chunk_size)
@@ -3,9 +3,11 @@ from datetime import datetime, date
 from supabase import create_client, Client
 from pathlib import Path
 import os
-import json
 import csv
 
+from app.utils.content_hash import get_content_hash_store
+from app.utils.file_utils import is_record_file, iter_records
+
 load_dotenv()
 
 url: str = os.environ.get("SUPABASE_URL")
@@ -17,91 +19,79 @@ clinicaltrials_folder: Path = Path(os.environ.get("OUTPUT_CT_DIR"))
 cms_folder: Path = Path(os.environ.get("OUTPUT_CMS_DIR"))
 physicians_folder: Path = Path(os.environ.get("SHARED_NPI_DIR"))
 
+# the publications table never uses abstract or language, so Parquet shards skip those columns
+PUBLICATION_COLUMNS = ["pmid", "title", "journal_title", "publication_types", "authors", "mesh_terms", "date_published"]
+
 def cache_pubmed_entries(start_year: int, end_year: int):
     for year in range(start_year, end_year + 1):
         year_folder = pubmed_folder / str(year)
         for file in year_folder.iterdir():
-            if not file.is_file():
+            # .jsonl or .parquet shards only, not .part leftovers
+            if not file.is_file() or not is_record_file(file):
                 continue
             
             entries = []
-            with file.open("r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line: continue
-
-                    data = json.loads(line)
-
-                    # must have primary key
-                    pubmed_id = data.get("pmid")
-                    if not pubmed_id: continue
-                    date_published = data.get("date_published")
-                    entry = {
-                        "pubmed_id": pubmed_id.strip(),
-                        "title": data.get("title").strip() if data.get("title") else None,
-                        "journal": data.get("journal_title").strip() if data.get("journal_title") else None,
-                        "publication_type": [p.strip() for p in data.get("publication_types", []) if p.strip()],
-                        "authors": data.get("authors"),
-                        "mesh_terms": [m.strip() for m in data.get("mesh_terms", []) if m.strip()],
-                        "published_date": parse_date(date_published),
-                        "published_year": int(date_published[:4]) if date_published else None
-                    }
-                    entries.append(entry)
-                    if len(entries) >= 500:
-                        print("Upserting 500 entries")
-                        # solves upsert error where duplicates may exist due to updating publications
-                        unique_entries = dedupe_list(entries, "pubmed_id")
-                        supabase.table("publications").upsert(unique_entries, on_conflict="pubmed_id").execute()
-                        entries.clear()
+            for data in iter_records(file, columns=PUBLICATION_COLUMNS):
+                # must have primary key
+                pubmed_id = data.get("pmid")
+                if not pubmed_id: continue
+                date_published = data.get("date_published")
+                entry = {
+                    "pubmed_id": pubmed_id.strip(),
+                    "title": data.get("title").strip() if data.get("title") else None,
+                    "journal": data.get("journal_title").strip() if data.get("journal_title") else None,
+                    "publication_type": [p.strip() for p in data.get("publication_types") or [] if p.strip()],
+                    "authors": data.get("authors"),
+                    "mesh_terms": [m.strip() for m in data.get("mesh_terms") or [] if m.strip()],
+                    "published_date": parse_date(date_published),
+                    "published_year": int(date_published[:4]) if date_published else None
+                }
+                entries.append(entry)
+                if len(entries) >= 500:
+                    print("Upserting 500 entries")
+                    upsert_changed("publications", entries, "pubmed_id")
+                    entries.clear()
             
             if entries:
                 print("Upserting final batch")
-                unique_entries = dedupe_list(entries, "pubmed_id")
-                supabase.table("publications").upsert(unique_entries, on_conflict="pubmed_id").execute()
+                upsert_changed("publications", entries, "pubmed_id")
 
 def cache_clinicaltrials_entries(start_year: int, end_year: int):
     for year in range(start_year, end_year + 1):
-        for file in clinicaltrials_folder.glob(f"*{year}.jsonl"):
-            if not file.is_file():
+        # clinicaltrials_<year>.jsonl plus .gz / .zst compressed exports
+        for file in clinicaltrials_folder.glob(f"*{year}.jsonl*"):
+            if not file.is_file() or not is_record_file(file):
                 continue
 
             entries = []
-            with file.open("r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line: continue
-
-                    data = json.loads(line)
-
-                    # must have primary key
-                    trial_id = data.get("nct_id")
-                    if not trial_id: continue
-                    start_date = data.get("start_date")
-                    completion_date = data.get("completion_date")
-                    entry = {
-                        "trial_id": trial_id.strip(),
-                        "title": data.get("brief_title").strip() if data.get("brief_title") else None,
-                        "lead_sponsor": data.get("lead_sponsor").strip() if data.get("lead_sponsor") else None,
-                        "conditions": [c.strip().upper() for c in data.get("conditions", []) if c.strip()],
-                        "phase": [p.strip().upper() for p in data.get("phase", []) if p.strip()],
-                        "status": data.get("status").strip() if data.get("status") else None,
-                        "start_date": parse_date(start_date),
-                        "start_year": int(start_date[:4]) if start_date else None,
-                        "completion_date": parse_date(completion_date),
-                        "completion_year": int(completion_date[:4]) if completion_date else None
-                    }
-                    entries.append(entry)
+            for data in iter_records(file):
+                # must have primary key
+                trial_id = data.get("nct_id")
+                if not trial_id: continue
+                start_date = data.get("start_date")
+                completion_date = data.get("completion_date")
+                entry = {
+                    "trial_id": trial_id.strip(),
+                    "title": data.get("brief_title").strip() if data.get("brief_title") else None,
+                    "lead_sponsor": data.get("lead_sponsor").strip() if data.get("lead_sponsor") else None,
+                    "conditions": [c.strip().upper() for c in data.get("conditions", []) if c.strip()],
+                    "phase": [p.strip().upper() for p in data.get("phase", []) if p.strip()],
+                    "status": data.get("status").strip() if data.get("status") else None,
+                    "start_date": parse_date(start_date),
+                    "start_year": int(start_date[:4]) if start_date else None,
+                    "completion_date": parse_date(completion_date),
+                    "completion_year": int(completion_date[:4]) if completion_date else None
+                }
+                entries.append(entry)
 
-                    if len(entries) >= 500:
-                        print("Upserting 500 entries")
-                        unique_entries = dedupe_list(entries, "trial_id")
-                        supabase.table("clinicaltrials").upsert(unique_entries, on_conflict="trial_id").execute()
-                        entries.clear()
+                if len(entries) >= 500:
+                    print("Upserting 500 entries")
+                    upsert_changed("clinicaltrials", entries, "trial_id")
+                    entries.clear()
             
             if entries:
                 print("Upserting final batch")
-                unique_entries = dedupe_list(entries, "trial_id")
-                supabase.table("clinicaltrials").upsert(unique_entries, on_conflict="trial_id").execute()
+                upsert_changed("clinicaltrials", entries, "trial_id")
 
 def cache_cms_payment_entries(start_year: int, end_year: int):
     for year in range(start_year, end_year + 1):
@@ -131,14 +121,12 @@ def cache_cms_payment_entries(start_year: int, end_year: int):
                     entries.append(entry)
                     if len(entries) >= 500:
                         print("Upserting 500 entries")
-                        unique_entries = dedupe_list(entries, "record_id")
-                        supabase.table("payments").upsert(unique_entries, on_conflict="record_id").execute()
+                        upsert_changed("payments", entries, "record_id")
                         entries.clear()
             
             if entries:
                 print("Upserting final batch")
-                unique_entries = dedupe_list(entries, "record_id")
-                supabase.table("payments").upsert(unique_entries, on_conflict="record_id").execute()
+                upsert_changed("payments", entries, "record_id")
 
 def cache_physician_entries():
     for file in physicians_folder.glob("*CA.csv"):
@@ -177,14 +165,26 @@ def cache_physician_entries():
                 entries.append(entry)
                 if len(entries) >= 500:
                     print("Upserting 500 entries")
-                    unique_entries = dedupe_list(entries, "npi_id")
-                    supabase.table("physicians").upsert(unique_entries, on_conflict="npi_id").execute()
+                    upsert_changed("physicians", entries, "npi_id")
                     entries.clear()
         
         if entries:
             print("Upserting final batch")
-            unique_entries = dedupe_list(entries, "npi_id")
-            supabase.table("physicians").upsert(unique_entries, on_conflict="npi_id").execute()
+            upsert_changed("physicians", entries, "npi_id")
+
+def upsert_changed(table: str, entries: list[dict], key: str):
+    # solves upsert error where duplicates may exist due to updating publications
+    unique_entries = dedupe_list(entries, key)
+    # with CONTENT_HASH_DB set, records whose hash matches the last upload are not re-sent
+    store = get_content_hash_store()
+    if store is None:
+        supabase.table(table).upsert(unique_entries, on_conflict=key).execute()
+        return
+    changed = store.changed(table, unique_entries, key)
+    if changed:
+        supabase.table(table).upsert([entry for entry, _ in changed], on_conflict=key).execute()
+        store.record(table, changed, key)
+    print(f"{len(changed)} of {len(unique_entries)} {table} entries new or changed")
 
 def join_list(list: list[str]):
     return ", ".join(list) if list else None
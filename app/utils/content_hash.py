@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+CONTENT_HASH_DB = os.getenv("CONTENT_HASH_DB")
+
+def content_hash(record, exclude=("content_hash",)):
+    # sha256 of the record's canonical JSON (sorted keys, dates as ISO strings), so the same
+    # content always hashes the same whatever order the fields were built in
+    data = {k: v for k, v in record.items() if k not in exclude}
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ContentHashStore:
+    # Last written hash per (table, key) for targets we cannot add a column to, like the
+    # Supabase tables: changed() filters a batch down to new or modified records, record()
+    # stores their hashes once the write succeeded.
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                tbl TEXT NOT NULL,
+                key TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (tbl, key)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    def changed(self, table, entries, key):
+        # [(entry, hash)] for entries whose hash differs from the stored one
+        hashed = [(entry, content_hash(entry)) for entry in entries]
+        keys = [str(entry[key]) for entry, _ in hashed]
+        stored = {}
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, hash FROM hashes WHERE tbl = ? AND key IN ({','.join('?' * len(chunk))})",
+                    (table, *chunk),
+                ).fetchall()
+                stored.update(rows)
+        return [(entry, digest) for (entry, digest), k in zip(hashed, keys) if stored.get(k) != digest]
+
+    def record(self, table, hashed, key):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO hashes (tbl, key, hash) VALUES (?, ?, ?) ON CONFLICT(tbl, key) DO UPDATE SET hash = excluded.hash",
+                [(table, str(entry[key]), digest) for entry, digest in hashed],
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+def get_content_hash_store():
+    # process-wide store when CONTENT_HASH_DB is set, otherwise None (every record is written)
+    global _shared_store
+    if not CONTENT_HASH_DB:
+        return None
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = ContentHashStore(CONTENT_HASH_DB)
+        return _shared_store
@@ -0,0 +1,91 @@
+import io
+import os
+import gzip
+import json
+
+PARQUET_BATCH_ROWS = 10000
+RECORD_EXTENSIONS = (".jsonl", ".parquet")
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+def is_record_file(path) -> bool:
+    name = str(path)
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if suffix and name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name.endswith(RECORD_EXTENSIONS)
+
+def detect_compression(path) -> str | None:
+    # Sniff magic bytes rather than trust the extension
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+def open_binary(path, mode: str = "rb", compression: str | None = None):
+    # Reads detect compression themselves; writes use the compression given
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression {compression!r}, expected one of {list(COMPRESSION_SUFFIXES)}")
+    if "r" in mode:
+        compression = detect_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL)
+    if compression == "zstd":
+        import zstandard
+        if "r" in mode:
+            # stream_reader has no readline; BufferedReader adds line iteration
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, "wb"), closefd=True)
+    return open(path, mode)
+
+def open_text(path, mode: str = "r", compression: str | None = None):
+    if "r" in mode and detect_compression(path) is None:
+        return open(path, mode, encoding="utf-8")
+    return io.TextIOWrapper(open_binary(path, mode.replace("t", "") + "b", compression), encoding="utf-8")
+
+def iter_records(path, columns: list[str] | None = None):
+    # Dict per row from a JSONL (plain, gzip or zstd) or Parquet export; columns prunes what is read/returned
+    if str(path).endswith(".parquet"):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        if columns is None:
+            for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS):
+                yield from batch.to_pylist()
+            return
+        # projected shards may lack some columns; those come back as None, as in JSONL
+        names = set(parquet_file.schema_arrow.names)
+        present = [column for column in columns if column in names]
+        for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_ROWS, columns=present):
+            for row in batch.to_pylist():
+                yield {column: row.get(column) for column in columns}
+        return
+
+    with open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if columns is not None:
+                record = {column: record.get(column) for column in columns}
+            yield record
+
+def load_json_state(path, default=None):
+    # Small JSON state file (manifests, sync watermarks); `default` when it does not exist yet
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return default
+
+def save_json_state(path, state):
+    # Written to a .part file and renamed, so a crash never leaves a half-written state file
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR")
+DEFAULT_TTL = int(os.getenv("HTTP_CACHE_TTL", 24 * 60 * 60))
+DEFAULT_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_MB", 2048)) * (1 << 20)
+INDEX_FILENAME = "http_cache.sqlite"
+
+class HttpCache:
+    # Responses keyed by method + url + params. Bodies are stored once per content hash under
+    # bodies/, the sqlite index tracks freshness, validators and last access. Entries older
+    # than ttl are revalidated with If-None-Match / If-Modified-Since when the server sent an
+    # ETag or Last-Modified, and the least recently used ones are evicted past max_bytes.
+    def __init__(self, cache_dir, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(cache_dir, "bodies"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, INDEX_FILENAME), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                etag TEXT,
+                last_modified TEXT
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self.conn.commit()
+
+    def key(self, method, url, params=None):
+        params = sorted((str(k), str(v)) for k, v in (params or {}).items() if k != "api_key")
+        raw = json.dumps([method.upper(), url, params], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        # {"body", "fresh", "etag", "last_modified"} or None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT digest, stored_at, etag, last_modified FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            digest, stored_at, etag, last_modified = row
+            try:
+                with open(self.body_path(digest), "rb") as f:
+                    body = f.read()
+            except FileNotFoundError:
+                self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return {
+            "body": body,
+            "fresh": time.time() - stored_at < self.ttl,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+
+    def validators(self, entry):
+        # conditional request headers for a stale entry
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def refresh(self, key):
+        # the server answered 304: the stored body is good for another ttl
+        with self.lock:
+            now = time.time()
+            self.conn.execute("UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            self.conn.commit()
+
+    def writer(self):
+        return BodyWriter(self.cache_dir)
+
+    def put(self, key, url, body, headers=None):
+        writer = self.writer()
+        writer.write(body)
+        self.commit(key, url, writer, headers)
+
+    def commit(self, key, url, writer, headers=None):
+        headers = headers or {}
+        digest, size = writer.close()
+        path = self.body_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(writer.path, path)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO entries (key, url, digest, size, stored_at, accessed_at, etag, last_modified)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET url = excluded.url, digest = excluded.digest, size = excluded.size,
+                    stored_at = excluded.stored_at, accessed_at = excluded.accessed_at,
+                    etag = excluded.etag, last_modified = excluded.last_modified
+                """,
+                (key, url, digest, size, now, now, headers.get("ETag"), headers.get("Last-Modified")),
+            )
+            self.conn.commit()
+            self.evict()
+
+    def evict(self):
+        # drop least recently used entries until the cache fits, and bodies nothing points at
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, digest, size FROM entries ORDER BY accessed_at").fetchall()
+        dropped = []
+        for key, digest, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            dropped.append(digest)
+            total -= size
+        self.conn.commit()
+        for digest in set(dropped):
+            if self.conn.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None:
+                try:
+                    os.remove(self.body_path(digest))
+                except FileNotFoundError:
+                    pass
+
+    def body_path(self, digest):
+        return os.path.join(self.cache_dir, "bodies", digest[:2], digest)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BodyWriter:
+    # Temp file + running sha256, so a streamed body is hashed while it is being consumed
+    def __init__(self, cache_dir):
+        fd, self.path = tempfile.mkstemp(prefix="body_", suffix=".part", dir=os.path.join(cache_dir, "bodies"))
+        self.file = os.fdopen(fd, "wb")
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.sha.update(chunk)
+        self.size += len(chunk)
+
+    def close(self):
+        self.file.close()
+        return self.sha.hexdigest(), self.size
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def cached_get(url, params=None, cache=None, session=None, **kwargs):
+    # Body bytes for a GET through `session` (a requests.Session, or the requests module).
+    # Fresh cache hits never touch the network; stale ones revalidate with their validators.
+    if session is None:
+        import requests as session
+    key = cache.key("GET", url, params) if cache is not None else None
+    entry = cache.get(key) if key else None
+    if entry and entry["fresh"]:
+        return entry["body"]
+
+    headers = {**kwargs.pop("headers", {}), **(cache.validators(entry) if entry else {})}
+    r = session.get(url, params=params, headers=headers, **kwargs)
+    if entry and r.status_code == 304:
+        cache.refresh(key)
+        return entry["body"]
+    r.raise_for_status()
+    if key:
+        cache.put(key, url, r.content, r.headers)
+    return r.content
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+def get_http_cache():
+    # process-wide cache when HTTP_CACHE_DIR is set, otherwise None (caching off)
+    global _shared_cache
+    if not HTTP_CACHE_DIR:
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = HttpCache(HTTP_CACHE_DIR)
+        return _shared_cache
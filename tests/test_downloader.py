@@ -0,0 +1,112 @@
+import ftplib
+import hashlib
+
+from app.services.pubmed.dataset_pipeline import downloader_baseline
+
+
+class FakeFtpServer:
+    # In-memory stand-in for the NCBI FTP directory, shared by every connection.
+    # drop_after cuts the next RETR of a file after that many bytes; corrupt serves one
+    # RETR of a file with its bytes flipped, at the right size.
+    def __init__(self, files):
+        self.files = dict(files)
+        for name, data in files.items():
+            self.files[f"{name}.md5"] = f"MD5({name})= {hashlib.md5(data).hexdigest()}\n".encode("ascii")
+        self.drop_after = {}
+        self.corrupt = set()
+        self.retrievals = []
+
+    def connection(self):
+        return FakeFtp(self)
+
+
+class FakeFtp:
+    def __init__(self, server):
+        self.server = server
+
+    def connect(self, host, port):
+        pass
+
+    def login(self):
+        pass
+
+    def cwd(self, path):
+        pass
+
+    def voidcmd(self, cmd):
+        pass
+
+    def nlst(self):
+        return sorted(self.server.files)
+
+    def size(self, filename):
+        return len(self.server.files[filename])
+
+    def retrbinary(self, cmd, callback, rest=None):
+        filename = cmd.split(" ", 1)[1]
+        if filename not in self.server.files:
+            raise ftplib.error_perm(f"550 {filename}: No such file")
+        data = self.server.files[filename]
+        if not filename.endswith(".md5"):
+            self.server.retrievals.append((filename, rest))
+        if filename in self.server.corrupt:
+            self.server.corrupt.discard(filename)
+            data = bytes(b ^ 0xFF for b in data)
+        data = data[rest or 0:]
+        cut = self.server.drop_after.pop(filename, None)
+        if cut is not None:
+            callback(data[:cut])
+            raise ftplib.error_temp("426 Connection closed; transfer aborted")
+        for i in range(0, len(data), 8192):
+            callback(data[i:i + 8192])
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def serve(monkeypatch, files):
+    server = FakeFtpServer(files)
+    monkeypatch.setattr(ftplib, "FTP", server.connection)
+    return server
+
+
+def test_interrupted_download_resumes_with_rest(tmp_path, monkeypatch):
+    data = bytes(range(256)) * 1000
+    server = serve(monkeypatch, {"pubmed25n0001.xml.gz": data})
+    server.drop_after["pubmed25n0001.xml.gz"] = 100000
+
+    failed = downloader_baseline.download_gz_files("ftp.example", "/pubmed/baseline/", str(tmp_path), workers=1)
+
+    assert failed == []
+    assert server.retrievals == [("pubmed25n0001.xml.gz", None), ("pubmed25n0001.xml.gz", 100000)]
+    assert (tmp_path / "pubmed25n0001.xml.gz").read_bytes() == data
+    assert (tmp_path / "pubmed25n0001.xml.gz.md5").exists()
+    assert not (tmp_path / "pubmed25n0001.xml.gz.part").exists()
+
+
+def test_checksum_mismatch_downloads_again(tmp_path, monkeypatch):
+    data = b"pubmed" * 50000
+    server = serve(monkeypatch, {"pubmed25n0002.xml.gz": data})
+    server.corrupt.add("pubmed25n0002.xml.gz")
+
+    failed = downloader_baseline.download_gz_files("ftp.example", "/pubmed/baseline/", str(tmp_path), workers=1)
+
+    assert failed == []
+    # the corrupt copy is discarded, so the second attempt starts from zero
+    assert server.retrievals == [("pubmed25n0002.xml.gz", None), ("pubmed25n0002.xml.gz", None)]
+    assert (tmp_path / "pubmed25n0002.xml.gz").read_bytes() == data
+
+
+def test_persistent_checksum_mismatch_is_reported(tmp_path, monkeypatch):
+    server = serve(monkeypatch, {"pubmed25n0003.xml.gz": b"pubmed" * 1000})
+    server.files["pubmed25n0003.xml.gz.md5"] = b"MD5(pubmed25n0003.xml.gz)= 00000000000000000000000000000000\n"
+
+    failed = downloader_baseline.download_gz_files("ftp.example", "/pubmed/baseline/", str(tmp_path), workers=1)
+
+    assert failed == ["pubmed25n0003.xml.gz"]
+    assert len(server.retrievals) == downloader_baseline.MAX_RETRIES
+    assert not (tmp_path / "pubmed25n0003.xml.gz").exists()
+    assert not (tmp_path / "pubmed25n0003.xml.gz.part").exists()
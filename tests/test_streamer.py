@@ -0,0 +1,33 @@
+import gzip
+import random
+
+from app.services.pubmed.dataset_pipeline.streamer import stream_pubmed_articles
+
+
+def write_truncated_pubmed_gz(path, articles=2000):
+    rng = random.Random(0)
+    words = ["cell", "tumor", "protein", "cohort", "dose", "trial", "mouse", "gene", "risk", "outcome"]
+    parts = ["<?xml version='1.0' encoding='utf-8'?>\n<PubmedArticleSet>\n"]
+    for pmid in range(1, articles + 1):
+        abstract = " ".join(rng.choice(words) + str(rng.randrange(10000)) for _ in range(60))
+        parts.append(
+            f"<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>"
+            f"<ArticleTitle>Article {pmid}</ArticleTitle>"
+            f"<Abstract><AbstractText>{abstract}</AbstractText></Abstract>"
+            f"</Article></MedlineCitation></PubmedArticle>\n"
+        )
+    parts.append("</PubmedArticleSet>\n")
+    data = gzip.compress("".join(parts).encode("utf-8"))
+    # cut the file in half, like an interrupted download
+    path.write_bytes(data[:len(data) // 2])
+
+
+def test_prefetch_matches_serial_on_truncated_file(tmp_path):
+    path = tmp_path / "pubmed25n0001.xml.gz"
+    write_truncated_pubmed_gz(path)
+
+    serial = [article["pmid"] for article in stream_pubmed_articles(str(path), prefetch=False)]
+    prefetched = [article["pmid"] for article in stream_pubmed_articles(str(path), prefetch=True)]
+
+    assert serial
+    assert prefetched == serial